@@ -1,277 +1,25 @@
 from dotenv import load_dotenv
 load_dotenv()
 import streamlit as st
-import re
-import os
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import time
+import uuid
+import queue
 
-# Import Google's Generative AI library for Gemini
-import google.generativeai as genai
-
-# Configure Gemini API 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-# ---------------------------------------------------------------------
-# Utility Function to Extract Text
-# ---------------------------------------------------------------------
-def extract_text(response):
-    """Safely extract text from Gemini response."""
-    if hasattr(response, 'text'):
-        return response.text
-    return str(response)
-
-# ---------------------------------------------------------------------
-# Conversation Review Agent
-# ---------------------------------------------------------------------
-def create_conversation_review_agent():
-    """
-    Creates an agent that can review and provide insights on the conversation
-    based on the conversation history.
-    """
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
-    def review_conversation(conversation_log, review_focus=None):
-        """
-        Review the conversation with optional focus areas.
-        
-        :param conversation_log: Full conversation history
-        :param review_focus: Optional specific area to focus on (e.g., 'communication', 'sales strategy')
-        :return: Detailed review and insights
-        """
-        prompt = ("You are an advanced conversation analysis AI. Carefully review the following conversation "
-                  "and provide a comprehensive analysis. ")
-        
-        if review_focus:
-            prompt += f"Pay special attention to the {review_focus} aspects of the conversation. "
-        
-        prompt += ("\n\nKey areas to analyze:\n"
-                   "1. Communication Dynamics\n"
-                   "2. Effectiveness of Sales Approach\n"
-                   "3. Client's Underlying Needs and Concerns\n"
-                   "4. Missed Opportunities\n"
-                   "5. Potential Improvements\n\n"
-                   f"Conversation Log:\n{conversation_log}\n\n"
-                   "Provide a detailed, objective analysis with actionable insights.")
-        
-        response = model.generate_content(prompt)
-        return response.text
-    
-    return review_conversation
-
-# ---------------------------------------------------------------------
-# Gemini-2.0-Flash for Personality/Behavioral Analysis
-# ---------------------------------------------------------------------
-def create_gemini_analysis_agent(person_name, context):
-    """
-    Creates a specialized Gemini agent to analyze the provided context
-    and generate a comprehensive personality profile.
-    """
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    prompt = (f"You are an advanced personality analysis AI specialized in generating detailed personality insights. "
-              f"Your task is to analyze the provided context for {person_name} and create a comprehensive profile with insights, "
-              "including personality type, traits, communication style, buying preferences, and suggestions for effective engagement.\n\n"
-              "Context:\n{context}\n\n"
-              "Based on the above, generate a structured personality profile with the following sections:\n"
-              "1. Personality Overview\n2. Personality Compatibility\n3. Communication Style\n"
-              "4. Tips for Selling and Engagement\n5. Advanced Insights (DISC, OCEAN, etc.).\n\n"
-              "Analysis:").format(person_name=person_name, context=context)
-    
-    response = model.generate_content(prompt)
-    return response.text
-
-# ---------------------------------------------------------------------
-# Persona Agent
-# ---------------------------------------------------------------------
-def create_persona_agent(person_name, analysis_text=""):
-    """
-    Creates a persona agent for 'person_name' that can optionally include
-    the Gemini analysis_text to inform responses about the person's style.
-    """
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
-    def generate_response(chat_history, user_input):
-        prompt = (f"You are an AI version of {person_name}. Below is your personality analysis:\n"
-                  f"{analysis_text}\n\n"
-                  "You are participating in a virtual meeting with a BeGig sales representative. "
-                  "You have reviewed your public content and are ready to share your opinions. "
-                  "Keep your responses natural, thoughtful, and reflective of your style, background, and expertise.\n\n"
-                  f"Meeting Conversation History:\n{chat_history}\n\n"
-                  f"Query: {user_input}\n\n"
-                  "Response:")
-        
-        response = model.generate_content(prompt)
-        return response.text
-    
-    return generate_response
-
-# ---------------------------------------------------------------------
-# Sales Conversation Agent
-# ---------------------------------------------------------------------
-def create_sales_conversation_agent():
-    """
-    Sales agent representing BeGig, explaining the value proposition to the persona.
-    """
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
-    def generate_response(chat_history, user_input):
-        prompt = ("You are a sales expert representing BeGig using the Gemini 2.0 Flash model. You are in a virtual meeting with the client. "
-                  "Your goal is to clearly and persuasively explain BeGig's value proposition while being sensitive to the client's preferences. "
-                  "Keep in mind that the client typically prefers full-time employees but may be open to hearing how flexible solutions can also benefit them.\n\n"
-                  f"Meeting Conversation History:\n{chat_history}\n\n"
-                  f"Sales Query: {user_input}\n\n"
-                  "Sales Response:")
-        
-        response = model.generate_content(prompt)
-        return response.text
-    
-    return generate_response
-
-# ---------------------------------------------------------------------
-# Dynamic Persona Questions
-# ---------------------------------------------------------------------
-def generate_dynamic_persona_questions(person_name, conversation_log=""):
-    """
-    Generates dynamic, curiosity-driven, reflective, and open-ended questions for the persona
-    to inquire about deeper aspects of BeGig's offerings.
-    """
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    prompt = ("You are an insightful AI that helps generate dynamic, curiosity-driven, and reflective questions for a persona in a virtual meeting. "
-              f"Based on the persona name '{person_name}' and the following conversation context:\n\n"
-              f"{conversation_log}\n\n"
-              "Generate 3 to 5 open-ended questions that {person_name} might ask to gain deeper insights about BeGig's offerings. "
-              "Focus on topics such as talent matching, how flexible hires can transition to full-time roles, compliance across markets, and success stories. "
-              "Each question should be clear and engaging.")
-    
-    response = model.generate_content(prompt)
-    text_response = response.text
-    dynamic_questions = [q.strip() for q in text_response.split('\n') if q.strip()]
-    return dynamic_questions
-
-# ---------------------------------------------------------------------
-# Simulated Conversation with Dynamic Flow
-# ---------------------------------------------------------------------
-def simulate_meeting_conversation_with_fulltime_preference(persona_agent, sales_agent, persona_name="Unni Koroth", max_rounds=5):
-    """
-    Simulates a conversation between the persona and sales agent.
-    The conversation includes dynamic greetings, preference statements, and interactive Q&A.
-    """
-    conversation_log = "Meeting Conversation Start:\n"
-    st.info(f"--- Virtual Meeting Begins: {persona_name} with BeGig Sales ---")
-    
-    # Persona greeting
-    greeting_query = "Please provide a friendly greeting, introducing yourself and your role."
-    persona_greeting = persona_agent(conversation_log, greeting_query)
-    conversation_log += f"\n{persona_name}: {persona_greeting}\n"
-    
-    # Sales agent greeting
-    sales_greeting_query = "Please greet the client warmly and ask about their biggest challenge in scaling their team."
-    sales_greeting = sales_agent(conversation_log, sales_greeting_query)
-    conversation_log += f"\nBeGig Sales: {sales_greeting}\n"
-    
-    # Persona states full-time hiring preference
-    fulltime_query = "Please state your preference for full-time employees over freelancers, and explain why full-time hires offer more stability for your projects."
-    fulltime_preference = persona_agent(conversation_log, fulltime_query)
-    conversation_log += f"\n{persona_name}: {fulltime_preference}\n"
-    
-    # Sales agent objection handling and synergy exploration
-    objection_query = (
-        "Based on the client's preference for full-time hires, please provide an objection handling message "
-        "that explains how BeGig's hybrid solution can start with flexible hires that eventually transition to full-time roles. "
-        "Also, ask about the challenges the client faces with their current full-time hiring process."
-    )
-    sales_objection = sales_agent(conversation_log, objection_query)
-    conversation_log += f"\nBeGig Sales: {sales_objection}\n"
-    
-    # Generate dynamic questions and responses
-    dynamic_questions = generate_dynamic_persona_questions(persona_name, conversation_log)
-    rounds = min(max_rounds, len(dynamic_questions))
-    
-    for i in range(rounds):
-        # Persona asks a dynamic question
-        persona_question = dynamic_questions[i]
-        persona_text = persona_agent(conversation_log, persona_question)
-        conversation_log += f"\n{persona_name}: {persona_text}\n"
-        
-        # Sales dynamic response with a changing scenario
-        if i == 0:
-            scenario = "ai_matching"
-        elif i == 1:
-            scenario = "success_story"
-        elif i == 2:
-            scenario = "compliance"
-        else:
-            scenario = "success_story"
-        sales_query = f"Based on the conversation so far, please address the following question dynamically: '{persona_question}'. Provide an answer related to {scenario}."
-        sales_text = sales_agent(conversation_log, sales_query)
-        conversation_log += f"\nBeGig Sales: {sales_text}\n"
-    
-    return conversation_log
-
-# ---------------------------------------------------------------------
-# Refined Analysis & Final Tailored Pitch
-# ---------------------------------------------------------------------
-def create_refined_analysis(person_name, conversation_log):
-    """
-    Analyzes the conversation log to extract behavioral cues, communication style,
-    and decision-making preferences.
-    """
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    prompt = (f"You are an AI analyst who has observed a virtual meeting conversation with {person_name}, a potential client. "
-              "Based on the conversation history, analyze their communication style, personality traits, and behavioral cues. "
-              "Then, provide a summary of their style and suggest the best way to pitch BeGig to them, keeping in mind their preference "
-              "for full-time hires and overall strategic goals.\n\n"
-              f"Meeting Conversation History:\n{conversation_log}\n\n"
-              "Provide a detailed analysis focusing on communication style, key motivations, and tailored pitch strategies.")
-    
-    response = model.generate_content(prompt)
-    return response.text
-
-def generate_final_tailored_pitch(refined_analysis_text, conversation_log):
-    """
-    Uses the refined analysis to generate a final tailored sales pitch for BeGig.
-    """
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    prompt = ("Based on the following refined analysis and conversation history, create a final, tailored sales pitch "
-              "that addresses the client's specific needs, communication style, and potential concerns:\n\n"
-              f"Refined Analysis:\n{refined_analysis_text}\n\n"
-              f"Conversation History:\n{conversation_log}\n\n"
-              "Craft a compelling, personalized pitch that highlights how BeGig can solve their specific challenges.")
-    
-    response = model.generate_content(prompt)
-    return response.text
-
-# ---------------------------------------------------------------------
-# Cold Email Drafting
-# ---------------------------------------------------------------------
-def draft_cold_email(final_pitch, refined_analysis, analysis_text):
-    """
-    Uses the final tailored pitch, refined analysis, and detailed personality analysis
-    to draft a cold email.
-    """
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    prompt = ("You are a sales expert crafting a cold email to a prospective client. "
-              "Even though no meeting has taken place, you have in-depth insights about the client's personality, "
-              "communication style, and business needs derived from detailed analysis. Use the following insights to draft a compelling email:\n\n"
-              f"Detailed Personality Analysis:\n{analysis_text}\n\n"
-              f"Refined Analysis & Pitch Strategy:\n{refined_analysis}\n\n"
-              f"Final Tailored Pitch:\n{final_pitch}\n\n"
-              "Draft a cold email that introduces yourself, explains why you believe the client would benefit from BeGig's solution, "
-              "and invites them for a discussion. Do not reference any prior meeting or conversation—present it as a genuine cold outreach email. "
-              "Ensure the tone is professional, insightful, and engaging.")
-    
-    response = model.generate_content(prompt)
-    return response.text
+from persona_core import request_scheduler, run_persona_pipeline
+from profiler import default_profiler
+from record_store import get_default_store
+from response_cache import get_default_cache
 
 # ---------------------------------------------------------------------
 # Streamlit UI Integration
 # ---------------------------------------------------------------------
+RECORDS_PAGE_SIZE = 20
+
 def main():
     st.set_page_config(page_title="Persona Simulation", layout="wide")
     
-    # Initialize session state for conversation records
-    if 'conversation_records' not in st.session_state:
-        st.session_state.conversation_records = []
+    # Conversation records live on disk, shared across sessions and restarts
+    record_store = get_default_store()
     
     st.title("Persona Simulation")
     st.markdown(
@@ -327,75 +75,165 @@ Education:
 - Kannur University: Bachelor of Technology (BTech) in Electronics and Communications Engineering (May 2002 – May 2006)
 """)
     
-    # Conversation Review Agent in Sidebar
-    review_agent = create_conversation_review_agent()
+    simulation_modes = {
+        "Serial (most coherent)": 0,
+        "Pipelined (1 round ahead)": 1,
+        "Fully parallel rounds (fastest)": 4,
+    }
+    simulation_mode = st.sidebar.selectbox(
+        "Simulation Mode", list(simulation_modes),
+        help="Pipelined modes run meeting turns concurrently, trading some conversational coherence for speed."
+    )
+    
+    reuse_analyses = st.sidebar.checkbox(
+        "Reuse analyses of near-duplicate personas", value=True,
+        help="Skips or shortens the personality analysis when a stored persona has a nearly identical context."
+    )
+    
+    cache_stats = get_default_cache().stats()
+    st.sidebar.caption(
+        f"Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+        f"({cache_stats['hit_rate']:.0%} hit rate)"
+    )
+    scheduler_metrics = request_scheduler.metrics()
+    st.sidebar.caption(
+        f"Gemini requests: {scheduler_metrics['queue_depth']} queued, {scheduler_metrics['in_flight']} in flight, "
+        f"{scheduler_metrics['retries']} retries, p50 {scheduler_metrics['latency_p50']:.1f}s / "
+        f"p95 {scheduler_metrics['latency_p95']:.1f}s"
+    )
     
-    # View Conversation Records Button
-    if st.sidebar.button("View Conversation Records"):
-        if st.session_state.conversation_records:
-            st.sidebar.subheader("Conversation Records")
-            for i, record in enumerate(st.session_state.conversation_records, 1):
-                with st.sidebar.expander(f"Conversation {i}"):
-                    st.write("Persona:", record['persona_name'])
-                    st.text_area("Conversation Log", record['conversation_log'], height=200)
-                    st.text_area("Conversation Review", record['conversation_review'], height=200)
+    # View Conversation Records: one page of summaries at a time, full text loaded only for the selected record
+    if st.sidebar.checkbox("View Conversation Records"):
+        st.sidebar.subheader("Conversation Records")
+        records_query = st.sidebar.text_input("Search logs and reviews", key="records_query")
+        records_persona = st.sidebar.text_input("Filter by persona", key="records_persona")
+        total_records = record_store.count(query=records_query, persona_name=records_persona)
+        if total_records:
+            page_count = (total_records + RECORDS_PAGE_SIZE - 1) // RECORDS_PAGE_SIZE
+            page = st.sidebar.number_input("Page", min_value=1, max_value=page_count, value=1, key="records_page")
+            summaries = record_store.list_records(page=page, page_size=RECORDS_PAGE_SIZE,
+                                                  query=records_query, persona_name=records_persona)
+            summary = st.sidebar.selectbox(
+                f"Conversation ({total_records} found)", summaries, key="records_selected",
+                format_func=lambda r: f"#{r['id']} {r['persona_name']} ({time.strftime('%Y-%m-%d %H:%M', time.localtime(r['created_at']))})"
+            )
+            record = record_store.get(summary['id'])
+            st.sidebar.write("Persona:", record['persona_name'])
+            st.sidebar.text_area("Conversation Log", record['conversation_log'], height=200, key=f"record_log_{record['id']}")
+            st.sidebar.text_area("Conversation Review", record['conversation_review'], height=200, key=f"record_review_{record['id']}")
         else:
             st.sidebar.info("No conversation records available. Run a simulation first.")
     
     if st.button("Run Analysis & Simulate Conversation"):
-        with st.spinner("Running personality analysis using Gemini 2.0 Flash..."):
-            # Create Gemini agent
-            analysis_text = create_gemini_analysis_agent(person_name, context_text)
-        
-        # Create Persona and Sales Agents
-        persona_agent = create_persona_agent(person_name, analysis_text=analysis_text)
-        sales_agent = create_sales_conversation_agent()
-        
-        with st.spinner("Simulating conversation..."):
-            conversation_log = simulate_meeting_conversation_with_fulltime_preference(
-                persona_agent, sales_agent, persona_name=person_name, max_rounds=4
+        st.info(f"--- Virtual Meeting Begins: {person_name} with BeGig Sales ---")
+        
+        # Sections fill in as soon as their stage finishes; the review runs
+        # concurrently with the refined analysis -> pitch -> email chain
+        stage_sections = {
+            'analysis_text': ("1. Detailed Personality Analysis", "Personality Analysis (Gemini 2.0 Flash)", 300),
+            'conversation_log': ("2. Final Conversation Log", "Conversation Log", 400),
+            'conversation_review': ("3. Conversation Review", "Conversation Review", 250),
+            'refined_analysis': ("4. Refined Analysis & Pitch Strategy", "Refined Analysis", 200),
+            'final_pitch': ("5. Final Tailored Pitch", "Final Tailored Pitch", 150),
+            'cold_email': ("6. Cold Email Draft", "Cold Email Draft", 250),
+        }
+        placeholders = {}
+        for name, (header, _, _) in stage_sections.items():
+            st.subheader(header)
+            placeholders[name] = st.empty()
+            placeholders[name].info("Waiting for results...")
+        
+        # Streamlit elements may only be updated from the script thread, so worker
+        # threads queue their streamed text and the pipeline's poll hook renders it
+        stream_updates = queue.Queue()
+        turn_container = None
+        turn_placeholders = {}
+        
+        def render_stream_updates():
+            nonlocal turn_container
+            latest = {}
+            while True:
+                try:
+                    key, text = stream_updates.get_nowait()
+                except queue.Empty:
+                    break
+                latest[key] = text
+            for key, text in latest.items():
+                if key[0] == 'turn':
+                    _, turn_index, speaker = key
+                    if turn_container is None:
+                        turn_container = placeholders['conversation_log'].container()
+                    # Pipelined meetings can stream later turns first; keep slots in turn order
+                    for index in range(len(turn_placeholders), turn_index + 1):
+                        turn_placeholders[index] = turn_container.empty()
+                    turn_placeholders[turn_index].markdown(f"**{speaker}:** {text}")
+                else:
+                    placeholders[key[1]].markdown(text)
+        
+        def render_stage(name, result, elapsed):
+            _, label, height = stage_sections[name]
+            with placeholders[name].container():
+                st.text_area(label, result, height=height)
+                st.caption(f"Completed in {elapsed:.1f}s")
+        
+        run_id = uuid.uuid4().hex[:12]
+        with st.spinner("Running analysis, simulating conversation and drafting outputs..."):
+            start = time.perf_counter()
+            results, stage_timings = run_persona_pipeline(
+                person_name, context_text, max_rounds=4, on_stage_complete=render_stage,
+                pipeline_lag=simulation_modes[simulation_mode], reuse_analyses=reuse_analyses,
+                on_stream=lambda name, text: stream_updates.put((('stage', name), text)),
+                on_turn=lambda turn_index, speaker, text: stream_updates.put((('turn', turn_index, speaker), text)),
+                on_poll=render_stream_updates, run_id=run_id
             )
+            stage_timings['total'] = time.perf_counter() - start
         
-        with st.spinner("Analyzing conversation for tailored pitch..."):
-            refined_analysis = create_refined_analysis(person_name, conversation_log)
-            final_pitch = generate_final_tailored_pitch(refined_analysis, conversation_log)
-        
-        with st.spinner("Drafting cold email..."):
-            cold_email = draft_cold_email(final_pitch, refined_analysis, analysis_text)
-        
-        # Review the conversation
-        with st.spinner("Generating conversation review..."):
-            conversation_review = review_agent(conversation_log)
-        
-        # Store conversation record in session state
+        # Store conversation record on disk
         conversation_record = {
             'persona_name': person_name,
-            'conversation_log': conversation_log,
-            'conversation_review': conversation_review,
-            'analysis_text': analysis_text,
-            'final_pitch': final_pitch,
-            'cold_email': cold_email
+            'conversation_log': results['conversation_log'],
+            'conversation_review': results['conversation_review'],
+            'analysis_text': results['analysis_text'],
+            'refined_analysis': results['refined_analysis'],
+            'final_pitch': results['final_pitch'],
+            'cold_email': results['cold_email'],
+            'stage_timings': stage_timings
         }
-        st.session_state.conversation_records.append(conversation_record)
-        
-        # Display the processed outputs in order
-        st.subheader("1. Detailed Personality Analysis")
-        st.text_area("Personality Analysis (Gemini 2.0 Flash)", analysis_text, height=300)
-        
-        st.subheader("2. Final Conversation Log")
-        st.text_area("Conversation Log", conversation_log, height=400)
-        
-        st.subheader("3. Conversation Review")
-        st.text_area("Conversation Review", conversation_review, height=250)
-        
-        st.subheader("4. Refined Analysis & Pitch Strategy")
-        st.text_area("Refined Analysis", refined_analysis, height=200)
-        
-        st.subheader("5. Final Tailored Pitch")
-        st.text_area("Final Tailored Pitch", final_pitch, height=150)
-        
-        st.subheader("6. Cold Email Draft")
-        st.text_area("Cold Email Draft", cold_email, height=250)
+        record_store.add(conversation_record)
+        
+        with st.expander("Stage Timings"):
+            st.table({'Stage': list(stage_timings), 'Seconds': [round(t, 2) for t in stage_timings.values()]})
+            run_summary = default_profiler.run_summary(run_id)
+            if run_summary:
+                st.caption(
+                    f"This run: {run_summary['calls']} model calls ({run_summary['cache_hits']} cached), "
+                    f"{run_summary['prompt_tokens']:,} prompt / {run_summary['output_tokens']:,} output tokens, "
+                    f"~${run_summary['cost']:.4f}, {run_summary['tokens_saved']:,} prompt tokens saved by compaction"
+                )
+    
+    render_performance_dashboard()
+
+def render_performance_dashboard():
+    """Shows per-stage latency percentiles, token counts and cost over recent model calls."""
+    stage_rows = default_profiler.stage_summary()
+    if not stage_rows:
+        return
+    with st.expander("Performance Dashboard (recent model calls)"):
+        st.table({
+            'Stage': [row['stage'] for row in stage_rows],
+            'Calls': [row['calls'] for row in stage_rows],
+            'p50 (s)': [round(row['p50_seconds'], 2) for row in stage_rows],
+            'p95 (s)': [round(row['p95_seconds'], 2) for row in stage_rows],
+            'Mean Prompt Tokens': [round(row['mean_prompt_tokens']) for row in stage_rows],
+            'Mean Output Tokens': [round(row['mean_output_tokens']) for row in stage_rows],
+            'Cost (USD)': [round(row['cost'], 4) for row in stage_rows],
+            'Cache Hit Rate': [f"{row['cache_hit_rate']:.0%}" for row in stage_rows],
+            'Tokens Saved': [row['tokens_saved'] for row in stage_rows],
+        })
+        st.download_button("Download Prometheus Metrics", default_profiler.prometheus_text(),
+                           file_name="persona_metrics.prom", mime="text/plain")
+        st.download_button("Download JSON Trace", default_profiler.trace_json(),
+                           file_name="persona_trace.json", mime="application/json")
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
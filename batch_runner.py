@@ -0,0 +1,193 @@
+"""
+Headless batch entry point: runs many personas through the full pipeline
+(analysis -> simulation -> refined analysis -> pitch -> email -> review)
+and streams results to a JSONL file that doubles as a resume checkpoint.
+
+Usage:
+    python batch_runner.py personas.jsonl -o results.jsonl --workers 8 --max-concurrent-requests 16
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import persona_core
+from profiler import default_profiler
+from rate_limiter import BATCH, request_priority
+
+# ---------------------------------------------------------------------
+# Persona Input
+# ---------------------------------------------------------------------
+def persona_id(persona):
+    """Returns the persona's explicit id, or a stable hash of its name and context."""
+    if persona.get('id'):
+        return str(persona['id'])
+    digest = hashlib.sha256(f"{persona['name']}\n{persona['context']}".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def read_personas(path):
+    """
+    Lazily yields personas from a JSONL or CSV file. Each row needs 'name' and
+    'context' fields and may carry an optional 'id'.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+
+        for row in rows:
+            persona = {
+                'id': row.get('id'),
+                'name': (row.get('name') or '').strip(),
+                'context': row.get('context') or '',
+            }
+            if not persona['name']:
+                continue
+            persona['id'] = persona_id(persona)
+            yield persona
+
+def load_completed_ids(output_path):
+    """Returns the ids of personas that already have a successful result in the output file."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write can leave a truncated last line
+                continue
+            if record.get('status') == 'ok':
+                completed.add(record['id'])
+    return completed
+
+def truncate_partial_line(output_path):
+    """Cuts a truncated last line left by a crash, so the next appended record starts on its own line."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        # Scan back in blocks to the last newline; the partial line is at most one record long
+        end = size
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+
+# ---------------------------------------------------------------------
+# Batch Execution
+# ---------------------------------------------------------------------
+def process_persona(persona, max_rounds, pipeline_lag=0):
+    """Runs the full pipeline for one persona and returns its output record."""
+    start = time.perf_counter()
+    try:
+        # Batch work queues behind interactive UI requests sharing the same scheduler
+        with request_priority(BATCH):
+            results, stage_timings = persona_core.run_persona_pipeline(
+                persona['name'], persona['context'], max_rounds=max_rounds, pipeline_lag=pipeline_lag,
+                run_id=persona['id']
+            )
+    except Exception as e:
+        return {
+            'id': persona['id'],
+            'persona_name': persona['name'],
+            'status': 'error',
+            'error': f"{type(e).__name__}: {e}",
+            'elapsed': time.perf_counter() - start,
+        }
+
+    record = {'id': persona['id'], 'persona_name': persona['name'], 'status': 'ok'}
+    record.update(results)
+    record['stage_timings'] = stage_timings
+    record['usage'] = default_profiler.run_summary(persona['id'])
+    record['elapsed'] = time.perf_counter() - start
+    return record
+
+def run_batch(input_path, output_path, workers=4, max_concurrent_requests=8, max_rounds=4, pipeline_lag=0):
+    """
+    Processes every persona in input_path that does not yet have a successful
+    result in output_path, appending one JSON record per persona as it finishes.
+
+    :param input_path: JSONL or CSV file of personas
+    :param output_path: JSONL results file, also used as the resume checkpoint
+    :param workers: Number of personas processed concurrently
+    :param max_concurrent_requests: Global cap on in-flight Gemini requests
+    :param max_rounds: Maximum number of dynamic Q&A rounds per simulated meeting
+    :param pipeline_lag: Rounds each simulated meeting may run ahead (0 = serial)
+    :return: Dict with counts of completed, failed and skipped personas
+    """
+    persona_core.set_max_concurrent_requests(max_concurrent_requests)
+    completed_ids = load_completed_ids(output_path)
+    truncate_partial_line(output_path)
+    summary = {'ok': 0, 'error': 0, 'skipped': 0}
+
+    personas = read_personas(input_path)
+    running = set()
+
+    with open(output_path, 'a', encoding='utf-8') as out, ThreadPoolExecutor(max_workers=workers) as executor:
+        def drain():
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.discard(future)
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+                summary[record['status']] += 1
+                print(f"[{record['status']}] {record['persona_name']} ({record['elapsed']:.1f}s)", file=sys.stderr)
+
+        for persona in personas:
+            if persona['id'] in completed_ids:
+                summary['skipped'] += 1
+                continue
+            # Keep a bounded window of personas in flight so huge inputs stream through
+            if len(running) >= workers * 2:
+                drain()
+            running.add(executor.submit(process_persona, persona, max_rounds, pipeline_lag))
+
+        while running:
+            drain()
+
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Run personas through the full simulation pipeline in batch.")
+    parser.add_argument("input", help="JSONL or CSV file with 'name' and 'context' fields (optional 'id')")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="JSONL results / checkpoint file")
+    parser.add_argument("--workers", type=int, default=4, help="Personas processed concurrently")
+    parser.add_argument("--max-concurrent-requests", type=int, default=8,
+                        help="Global cap on in-flight Gemini requests")
+    parser.add_argument("--max-rounds", type=int, default=4, help="Dynamic Q&A rounds per simulated meeting")
+    parser.add_argument("--pipeline-lag", type=int, default=0,
+                        help="Rounds a simulated meeting may run ahead of earlier answers (0 = serial)")
+    parser.add_argument("--metrics", help="Write per-stage Prometheus metrics to this file when done")
+    parser.add_argument("--trace", help="Write a Chrome/Perfetto JSON trace of recent model calls to this file when done")
+    args = parser.parse_args()
+
+    summary = run_batch(args.input, args.output, workers=args.workers,
+                        max_concurrent_requests=args.max_concurrent_requests, max_rounds=args.max_rounds,
+                        pipeline_lag=args.pipeline_lag)
+    print(f"Done: {summary['ok']} completed, {summary['error']} failed, {summary['skipped']} already done",
+          file=sys.stderr)
+    print(f"Gemini request metrics: {json.dumps(persona_core.request_scheduler.metrics())}", file=sys.stderr)
+    if args.metrics:
+        with open(args.metrics, 'w', encoding='utf-8') as f:
+            f.write(default_profiler.prometheus_text())
+    if args.trace:
+        with open(args.trace, 'w', encoding='utf-8') as f:
+            f.write(default_profiler.trace_json())
+
+if __name__ == "__main__":
+    main()
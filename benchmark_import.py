@@ -0,0 +1,81 @@
+"""
+Measures the cold-start cost of importing the headless pipeline core, as a
+batch worker or script pays it, and fails when it exceeds a budget or pulls in
+a heavy dependency that should only load on first use.
+
+Each sample imports the module in a fresh interpreter. The slowest imported
+modules are taken from python -X importtime.
+
+Usage:
+    python benchmark_import.py --module persona_core --runs 5 --max-seconds 1.0
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules that must not be loaded just by importing the core
+DEFERRED_MODULES = ('streamlit', 'sklearn', 'scipy', 'numpy', 'google.generativeai')
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [name for name in {deferred!r} if name in sys.modules]}}))
+"""
+
+def import_sample(module):
+    """Imports module in a fresh interpreter and returns (seconds, deferred modules it loaded)."""
+    probe = PROBE.format(module=module, deferred=DEFERRED_MODULES)
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    sample = json.loads(output.strip().splitlines()[-1])
+    return sample['seconds'], sample['loaded']
+
+def slowest_imports(module, top=10):
+    """Returns the top (cumulative microseconds, module name) pairs reported by -X importtime."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True,
+                            text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stderr
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings.append((int(cumulative), name.strip()))
+    return sorted(timings, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold import time of the persona pipeline core.")
+    parser.add_argument("--module", default="persona_core", help="Module to import")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh-interpreter samples")
+    parser.add_argument("--max-seconds", type=float, default=1.0, help="Budget for the median import time")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imported modules to list")
+    args = parser.parse_args()
+
+    samples, loaded = [], set()
+    for _ in range(args.runs):
+        seconds, deferred = import_sample(args.module)
+        samples.append(seconds)
+        loaded.update(deferred)
+    median = statistics.median(samples)
+
+    print(f"import {args.module}: median {median * 1000:.0f} ms, min {min(samples) * 1000:.0f} ms, "
+          f"max {max(samples) * 1000:.0f} ms over {args.runs} runs")
+    print("Slowest imports (cumulative):")
+    for cumulative, name in slowest_imports(args.module, args.top):
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+    failures = []
+    if median > args.max_seconds:
+        failures.append(f"median import time {median:.2f}s exceeds the {args.max_seconds:.2f}s budget")
+    if loaded:
+        failures.append(f"importing {args.module} loaded deferred modules: {', '.join(sorted(loaded))}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Offline load and regression benchmark for the full persona pipeline.
+
+Every model call goes to the deterministic local fake backend
+(model_backend.FakeBackend), so runs cost no quota and are repeatable. For
+each concurrency level the benchmark runs a set of personas through
+run_persona_pipeline and reports end-to-end latency, throughput, prompt-token
+growth per meeting round and peak Python memory. Results are appended to a
+JSONL file together with the current git commit, and --compare prints the
+change against the last stored run with the same settings.
+
+Usage:
+    python benchmark_pipeline.py --personas 8 --concurrency 1 4 8 --latency 0.2 --compare
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Benchmarks must not read from or write to the persistent cache, persona index or record store
+os.environ.setdefault("PERSONA_CACHE_PATH", "")
+os.environ.setdefault("PERSONA_CACHE_MAX_ENTRIES", "0")
+os.environ.setdefault("PERSONA_INDEX_PATH", "")
+os.environ.setdefault("PERSONA_RECORDS_PATH", "")
+
+import persona_core
+import prompt_compaction
+from model_backend import LATENCY_DISTRIBUTIONS, FakeBackend, set_backend
+from profiler import default_profiler, percentile
+
+DEFAULT_RESULTS_PATH = ".persona_benchmarks.jsonl"
+TURN_STAGES = ('persona_turn', 'sales_turn')
+OPENING_TURNS = 4
+BENCHMARK_CONTEXT = ("Head of engineering at a 200-person fintech scaling its platform team. "
+                     "Prefers full-time hires, worried about compliance across markets and onboarding time.")
+
+# ---------------------------------------------------------------------
+# Measurements
+# ---------------------------------------------------------------------
+def git_commit():
+    """Returns the short commit hash of the working tree (suffixed with -dirty if modified), or 'unknown'."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True, cwd=repo_dir).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True, cwd=repo_dir).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def prompt_tokens_by_round(run_ids):
+    """
+    Mean prompt tokens of meeting turns per round across runs. Turns are taken
+    in start order: the opening turns form round 0 and each later pair of
+    persona/sales turns forms the next round.
+    """
+    per_round = {}
+    for run_id in run_ids:
+        turns = sorted((call for call in default_profiler.calls(run_id) if call['stage'] in TURN_STAGES),
+                       key=lambda call: call['started_at'])
+        for index, call in enumerate(turns):
+            round_index = 0 if index < OPENING_TURNS else 1 + (index - OPENING_TURNS) // 2
+            per_round.setdefault(round_index, []).append(call['prompt_tokens'])
+    return [round(sum(tokens) / len(tokens)) for _, tokens in sorted(per_round.items())]
+
+def run_level(concurrency, personas, rounds, pipeline_lag):
+    """Runs personas through the pipeline with the given concurrency and returns its measurements."""
+    run_ids = [f"bench-{uuid.uuid4().hex[:12]}" for _ in range(personas)]
+    latencies = []
+
+    def run_one(index):
+        start = time.perf_counter()
+        # Distinct names keep prompts (and so fake responses) distinct across personas
+        persona_core.run_persona_pipeline(
+            f"Benchmark Persona {index}", BENCHMARK_CONTEXT, max_rounds=rounds, pipeline_lag=pipeline_lag,
+            reuse_analyses=False, run_id=run_ids[index]
+        )
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run_one, range(personas)))
+    wall = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    calls = [call for run_id in run_ids for call in default_profiler.calls(run_id)]
+    return {
+        'concurrency': concurrency,
+        'wall_seconds': wall,
+        'latency_p50': percentile(latencies, 50),
+        'latency_p95': percentile(latencies, 95),
+        'personas_per_minute': personas / wall * 60.0,
+        'calls_per_persona': len(calls) / personas,
+        'prompt_tokens_per_persona': sum(call['prompt_tokens'] for call in calls) / personas,
+        'prompt_tokens_by_round': prompt_tokens_by_round(run_ids),
+        'tokens_saved_per_persona': sum((default_profiler.run_summary(run_id) or {}).get('tokens_saved', 0)
+                                        for run_id in run_ids) / personas,
+        'peak_memory_mib': peak_memory / 2 ** 20,
+    }
+
+# ---------------------------------------------------------------------
+# Stored Results
+# ---------------------------------------------------------------------
+COMPARED_METRICS = ('latency_p50', 'latency_p95', 'personas_per_minute', 'prompt_tokens_per_persona', 'peak_memory_mib')
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def save_result(path, result):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(result) + "\n")
+
+def print_comparison(previous, current):
+    """Prints each compared metric of current next to the same concurrency level in previous."""
+    print(f"\nChange vs {previous['commit']} ({time.strftime('%Y-%m-%d %H:%M', time.localtime(previous['timestamp']))}):")
+    before_levels = {level['concurrency']: level for level in previous['levels']}
+    print(f"{'conc':>5} {'metric':<28} {'before':>10} {'after':>10} {'change':>8}")
+    for level in current['levels']:
+        before = before_levels.get(level['concurrency'])
+        if before is None:
+            continue
+        for metric in COMPARED_METRICS:
+            change = (level[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+            print(f"{level['concurrency']:>5} {metric:<28} {before[metric]:>10.2f} {level[metric]:>10.2f} {change:>+7.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the persona pipeline against a local fake model backend.")
+    parser.add_argument("--personas", type=int, default=8, help="Personas run at each concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8], help="Concurrent personas to compare")
+    parser.add_argument("--rounds", type=int, default=4, help="Dynamic Q&A rounds per simulated meeting")
+    parser.add_argument("--pipeline-lag", type=int, default=0, help="Simulation pipeline lag (0 = serial)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Median fake time to first token, in seconds")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal",
+                        help="Fake latency distribution")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Fake output token throughput")
+    parser.add_argument("--output-tokens", type=int, default=150, help="Mean fake output tokens per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake requests answered with a 429")
+    parser.add_argument("--fake-rpm", type=float, help="Fake server-side requests-per-minute quota")
+    parser.add_argument("--seed", type=int, default=0, help="Fake backend seed")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH, help="JSONL file results are appended to")
+    parser.add_argument("--label", default="", help="Free-form label stored with the result")
+    parser.add_argument("--no-save", action="store_true", help="Do not append this run to the results file")
+    parser.add_argument("--compare", action="store_true",
+                        help="Compare with the last stored run that used the same settings")
+    args = parser.parse_args()
+
+    config = {
+        'personas': args.personas, 'rounds': args.rounds, 'pipeline_lag': args.pipeline_lag,
+        'latency': args.latency, 'distribution': args.distribution, 'tokens_per_second': args.tokens_per_second,
+        'output_tokens': args.output_tokens, 'error_rate': args.error_rate, 'fake_rpm': args.fake_rpm,
+        'seed': args.seed,
+    }
+    backend = FakeBackend(latency=args.latency, latency_distribution=args.distribution,
+                          tokens_per_second=args.tokens_per_second, output_tokens=args.output_tokens,
+                          error_rate=args.error_rate, requests_per_minute=args.fake_rpm, seed=args.seed)
+    set_backend(backend)
+    # Retries against the fake should not wait for real-world backoff
+    persona_core.request_scheduler.base_backoff = min(persona_core.request_scheduler.base_backoff, args.latency)
+
+    # Load the compactor's scikit-learn up front so no level measures the import
+    prompt_compaction.warm_up()
+    levels = []
+    print(f"{'conc':>5} {'wall (s)':>9} {'p50 (s)':>8} {'p95 (s)':>8} {'personas/min':>13} {'peak MiB':>9} {'saved/persona':>14}  prompt tokens by round")
+    for concurrency in args.concurrency:
+        level = run_level(concurrency, args.personas, args.rounds, args.pipeline_lag)
+        levels.append(level)
+        print(f"{concurrency:>5} {level['wall_seconds']:>9.2f} {level['latency_p50']:>8.2f} {level['latency_p95']:>8.2f} "
+              f"{level['personas_per_minute']:>13.1f} {level['peak_memory_mib']:>9.1f} {level['tokens_saved_per_persona']:>14.0f}  {level['prompt_tokens_by_round']}")
+    print(f"Fake backend: {json.dumps(backend.stats())}; scheduler: {json.dumps(persona_core.request_scheduler.metrics())}",
+          file=sys.stderr)
+
+    result = {'commit': git_commit(), 'timestamp': time.time(), 'label': args.label, 'config': config, 'levels': levels}
+    if args.compare:
+        previous = [stored for stored in load_results(args.results) if stored['config'] == config]
+        if previous:
+            print_comparison(previous[-1], result)
+        else:
+            print("\nNo stored run with the same settings to compare against.")
+    if not args.no_save:
+        save_result(args.results, result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmarks the simulated meeting in serial and pipelined modes, reporting
+wall-clock time and a coherence proxy: the share of turns whose context
+included the turn immediately before them in the final log.
+
+By default the agents are deterministic local stand-ins with a configurable
+per-call latency, so the benchmark costs no quota. Pass --live to use Gemini.
+
+Usage:
+    python benchmark_simulation.py --rounds 4 --latency 1.0 --lags 0 1 4
+"""
+import argparse
+import itertools
+import re
+import threading
+import time
+
+import persona_core
+
+REPLY_TOKEN = re.compile(r'Reply-\d+')
+
+# ---------------------------------------------------------------------
+# Local Stand-in Agents
+# ---------------------------------------------------------------------
+class StandInAgents:
+    """Sleeps for a fixed latency per call and records the context each turn saw."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.contexts = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _reply(self, chat_history, user_input, on_text=None):
+        time.sleep(self.latency)
+        with self._lock:
+            token = f"Reply-{next(self._ids)}"
+            self.contexts[token] = chat_history
+        text = f"{token}. Answering: {user_input[:60]}"
+        if on_text:
+            on_text(text)
+        return text
+
+    def persona(self, chat_history, user_input, on_text=None):
+        return self._reply(chat_history, user_input, on_text)
+
+    def sales(self, chat_history, user_input, on_text=None):
+        return self._reply(chat_history, user_input, on_text)
+
+    def questions(self, person_name, conversation_log):
+        time.sleep(self.latency)
+        return [f"Question {i + 1} about BeGig?" for i in range(5)]
+
+def previous_turn_visibility(conversation_log, contexts):
+    """Share of turns (after the first) whose context contained the preceding turn."""
+    tokens = REPLY_TOKEN.findall(conversation_log)
+    pairs = list(zip(tokens, tokens[1:]))
+    if not pairs:
+        return 1.0
+    return sum(f"{previous}." in contexts.get(current, '') for previous, current in pairs) / len(pairs)
+
+# ---------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------
+def run_once(pipeline_lag, rounds, latency, live=False, persona_name="Benchmark Persona"):
+    """Runs one simulated meeting and returns (wall seconds, coherence or None)."""
+    if live:
+        persona_agent = persona_core.create_persona_agent(persona_name)
+        sales_agent = persona_core.create_sales_conversation_agent()
+        question_agent = None
+        agents = None
+    else:
+        agents = StandInAgents(latency)
+        persona_agent, sales_agent, question_agent = agents.persona, agents.sales, agents.questions
+
+    start = time.perf_counter()
+    conversation_log = persona_core.simulate_meeting_conversation_with_fulltime_preference(
+        persona_agent, sales_agent, persona_name=persona_name, max_rounds=rounds, show_banner=False,
+        pipeline_lag=pipeline_lag, question_agent=question_agent
+    )
+    elapsed = time.perf_counter() - start
+    coherence = previous_turn_visibility(conversation_log, agents.contexts) if agents else None
+    return elapsed, coherence
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare serial and pipelined simulated meetings.")
+    parser.add_argument("--rounds", type=int, default=4, help="Dynamic Q&A rounds per meeting")
+    parser.add_argument("--latency", type=float, default=1.0, help="Stand-in latency per call, in seconds")
+    parser.add_argument("--lags", type=int, nargs="+", default=[0, 1, 4], help="Pipeline lags to compare")
+    parser.add_argument("--live", action="store_true", help="Use real Gemini agents instead of stand-ins")
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'lag':>4} {'wall (s)':>10} {'speedup':>8} {'coherence':>10}")
+    for lag in args.lags:
+        elapsed, coherence = run_once(lag, args.rounds, args.latency, live=args.live)
+        baseline = baseline or elapsed
+        coherence_text = f"{coherence:.0%}" if coherence is not None else "n/a"
+        print(f"{lag:>4} {elapsed:>10.2f} {baseline / elapsed:>7.2f}x {coherence_text:>10}")
+
+if __name__ == "__main__":
+    main()
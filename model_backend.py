@@ -0,0 +1,312 @@
+import abc
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# ---------------------------------------------------------------------
+# Model Backends
+# ---------------------------------------------------------------------
+DEFAULT_MODEL_NAME = os.getenv("PERSONA_MODEL_NAME", "gemini-2.0-flash")
+
+class ModelBackend(abc.ABC):
+    """
+    Creates the generative models the agents send prompts to. A model needs a
+    model_name, the system instruction it was created with (_system_instruction,
+    part of the response cache key) and generate_content(prompt,
+    generation_config=None, stream=False) returning a response with .text and
+    .usage_metadata that, when streamed, iterates over chunks with .text. The
+    awaitable generate_content_async takes the same arguments; its streamed
+    response is consumed with async for.
+    """
+
+    name = 'base'
+
+    @abc.abstractmethod
+    def create_model(self, model_name, system_instruction=None):
+        """Returns a model for model_name created with the given system instruction."""
+
+class GeminiBackend(ModelBackend):
+    """
+    Google Gemini through google.generativeai, configured with GOOGLE_API_KEY on
+    first use. The SDK keeps one process-wide sync client and one async (gRPC)
+    client that every model shares, so models are cheap to create and requests
+    reuse pooled connections. The async client is bound to the event loop that
+    first uses it, so async callers should share a single loop per process.
+    """
+
+    name = 'gemini'
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+        self._configured = False
+        self._lock = threading.Lock()
+
+    def create_model(self, model_name, system_instruction=None):
+        import google.generativeai as genai
+        with self._lock:
+            if not self._configured:
+                genai.configure(api_key=self.api_key or os.getenv("GOOGLE_API_KEY"))
+                self._configured = True
+        return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+# ---------------------------------------------------------------------
+# Deterministic Local Fake Backend
+# ---------------------------------------------------------------------
+LATENCY_DISTRIBUTIONS = ('constant', 'uniform', 'exponential', 'lognormal')
+# Failing requests whose retry count the fake backend remembers; the oldest are forgotten first
+MAX_TRACKED_ATTEMPTS = 1024
+FAKE_WORDS = (
+    "talent", "flexible", "hiring", "team", "growth", "budget", "timeline", "quality", "compliance",
+    "culture", "transition", "roles", "markets", "value", "engagement", "project", "expertise", "trust",
+)
+
+class ResourceExhausted(Exception):
+    """Quota error raised by the fake backend; classified like the SDK's 429 ResourceExhausted."""
+    code = 429
+
+class FakeUsage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+class FakeResponse:
+    """Response whose chunks are released at the backend's token throughput as it is iterated."""
+
+    def __init__(self, text, usage_metadata, chunks=(), chunk_delay=0.0):
+        self.text = text
+        self.usage_metadata = usage_metadata
+        self._chunks = chunks
+        self._chunk_delay = chunk_delay
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            time.sleep(self._chunk_delay)
+            yield FakeChunk(chunk)
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._chunk_delay)
+            yield FakeChunk(chunk)
+
+class FakeModel:
+    def __init__(self, backend, model_name, system_instruction=None):
+        self.backend = backend
+        self.model_name = f"fake/{model_name}"
+        self._system_instruction = system_instruction
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        return self.backend.generate(self, prompt, generation_config=generation_config, stream=stream)
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        return await self.backend.generate_async(self, prompt, generation_config=generation_config, stream=stream)
+
+class FakeBackend(ModelBackend):
+    """
+    Offline stand-in for Gemini used for load and regression testing. Response
+    text, latency and injected 429s are derived from a seeded hash of the
+    request, so a run with the same seed and prompts behaves the same way
+    every time. Requests with a JSON response_mime_type and response_schema get
+    JSON that matches the schema. Each request waits a time-to-first-token drawn from the chosen
+    latency distribution, then produces its output at tokens_per_second,
+    either all at once or as streamed chunks.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency=0.5, latency_distribution='lognormal', latency_spread=0.5, tokens_per_second=200.0,
+                 output_tokens=150, chunk_tokens=20, error_rate=0.0, requests_per_minute=None, seed=0):
+        """
+        :param latency: Median time to first token, in seconds
+        :param latency_distribution: One of LATENCY_DISTRIBUTIONS
+        :param latency_spread: Relative spread (uniform: +/- fraction of latency; lognormal: sigma)
+        :param tokens_per_second: Output token throughput
+        :param output_tokens: Mean output tokens per response
+        :param chunk_tokens: Output tokens per streamed chunk
+        :param error_rate: Probability that a request fails with a 429
+        :param requests_per_minute: Server-side quota; requests beyond it in any 60s window get a 429
+        :param seed: Seed mixed into every per-request random draw
+        """
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        self.latency_spread = latency_spread
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.chunk_tokens = chunk_tokens
+        self.error_rate = error_rate
+        self.requests_per_minute = requests_per_minute
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._attempts = {}
+        self._recent = deque()
+        self.requests = 0
+        self.rate_limited = 0
+
+    @classmethod
+    def from_env(cls):
+        """Builds a fake backend from the PERSONA_FAKE_* environment variables."""
+        requests_per_minute = os.getenv("PERSONA_FAKE_RPM")
+        return cls(
+            latency=float(os.getenv("PERSONA_FAKE_LATENCY", "0.5")),
+            latency_distribution=os.getenv("PERSONA_FAKE_LATENCY_DISTRIBUTION", "lognormal"),
+            tokens_per_second=float(os.getenv("PERSONA_FAKE_TOKENS_PER_SECOND", "200")),
+            output_tokens=int(os.getenv("PERSONA_FAKE_OUTPUT_TOKENS", "150")),
+            error_rate=float(os.getenv("PERSONA_FAKE_ERROR_RATE", "0")),
+            requests_per_minute=float(requests_per_minute) if requests_per_minute else None,
+            seed=int(os.getenv("PERSONA_FAKE_SEED", "0")),
+        )
+
+    def create_model(self, model_name, system_instruction=None):
+        return FakeModel(self, model_name, system_instruction)
+
+    def _sample_latency(self, rng):
+        if self.latency_distribution == 'constant':
+            return self.latency
+        if self.latency_distribution == 'uniform':
+            return rng.uniform(self.latency * (1 - self.latency_spread), self.latency * (1 + self.latency_spread))
+        if self.latency_distribution == 'exponential':
+            return rng.expovariate(1.0 / self.latency) if self.latency > 0 else 0.0
+        return self.latency * math.exp(rng.gauss(0.0, self.latency_spread))
+
+    def _text(self, rng, output_tokens):
+        """Builds roughly output_tokens tokens (~4 characters each) of text, one sentence per line."""
+        words, lines, length = [], [], 0
+        while length < output_tokens * 4:
+            word = rng.choice(FAKE_WORDS)
+            words.append(word)
+            length += len(word) + 1
+            if len(words) >= 8:
+                lines.append(" ".join(words).capitalize() + "?")
+                words = []
+        if words:
+            lines.append(" ".join(words).capitalize() + "?")
+        return "\n".join(lines)
+
+    def _schema_value(self, rng, schema, output_tokens):
+        """Builds a value matching a (subset of OpenAPI) response schema, spreading output_tokens over its strings."""
+        kind = str(schema.get('type', 'string')).lower()
+        if kind == 'object':
+            properties = schema.get('properties', {})
+            share = max(1, output_tokens // max(1, len(properties)))
+            return {key: self._schema_value(rng, value, share) for key, value in properties.items()}
+        if kind == 'array':
+            count = rng.randint(3, 5)
+            return [self._schema_value(rng, schema.get('items', {}), max(1, output_tokens // count)) for _ in range(count)]
+        if kind in ('integer', 'number'):
+            return rng.randint(1, 10)
+        return self._text(rng, output_tokens).replace("\n", " ")
+
+    def _draw(self, model, prompt, generation_config=None):
+        """
+        Draws one request's outcome: raises ResourceExhausted for an injected or
+        over-quota 429, otherwise returns (text, usage, time to first token).
+        """
+        system_instruction = model._system_instruction or ""
+        config = generation_config or {}
+        config = config if isinstance(config, dict) else vars(config)
+        schema = config.get('response_schema') if config.get('response_mime_type') == 'application/json' else None
+        schema_key = f"{json.dumps(schema, sort_keys=True)}\n" if schema else ""
+        request_key = hashlib.sha256(f"{model.model_name}\n{system_instruction}\n{schema_key}{prompt}".encode('utf-8')).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            attempt = self._attempts.pop(request_key, 0)
+            self.requests += 1
+            while self._recent and now - self._recent[0] > 60.0:
+                self._recent.popleft()
+            over_quota = self.requests_per_minute is not None and len(self._recent) >= self.requests_per_minute
+            if not over_quota:
+                self._recent.append(now)
+
+        # Text depends only on the request; latency and errors also vary with the attempt
+        text_rng = random.Random(f"{self.seed}:{request_key}")
+        attempt_rng = random.Random(f"{self.seed}:{request_key}:{attempt}")
+        if over_quota or attempt_rng.random() < self.error_rate:
+            with self._lock:
+                self.rate_limited += 1
+                # Only failed requests are remembered, so the next retry draws a new outcome
+                self._attempts[request_key] = attempt + 1
+                if len(self._attempts) > MAX_TRACKED_ATTEMPTS:
+                    del self._attempts[next(iter(self._attempts))]
+            raise ResourceExhausted("429 Resource has been exhausted (fake backend)")
+
+        output_tokens = max(1, int(round(self.output_tokens * text_rng.uniform(0.5, 1.5))))
+        if schema:
+            text = json.dumps(self._schema_value(text_rng, schema, output_tokens))
+            output_tokens = max(1, len(text) // 4)
+        else:
+            text = self._text(text_rng, output_tokens)
+        usage = FakeUsage(max(1, len(system_instruction + prompt) // 4), output_tokens)
+        return text, usage, self._sample_latency(attempt_rng)
+
+    def _streamed(self, text, usage):
+        chunk_chars = self.chunk_tokens * 4
+        chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+        return FakeResponse(text, usage, chunks=chunks, chunk_delay=self.chunk_tokens / self.tokens_per_second)
+
+    def generate(self, model, prompt, generation_config=None, stream=False):
+        """Simulates one request; see the class docstring."""
+        text, usage, first_token_latency = self._draw(model, prompt, generation_config)
+        time.sleep(first_token_latency)
+        if stream:
+            return self._streamed(text, usage)
+        time.sleep(usage.candidates_token_count / self.tokens_per_second)
+        return FakeResponse(text, usage)
+
+    async def generate_async(self, model, prompt, generation_config=None, stream=False):
+        """Simulates one request without blocking the event loop."""
+        text, usage, first_token_latency = self._draw(model, prompt, generation_config)
+        await asyncio.sleep(first_token_latency)
+        if stream:
+            return self._streamed(text, usage)
+        await asyncio.sleep(usage.candidates_token_count / self.tokens_per_second)
+        return FakeResponse(text, usage)
+
+    def stats(self):
+        """Returns how many requests were received and how many were answered with a 429."""
+        with self._lock:
+            return {'requests': self.requests, 'rate_limited': self.rate_limited}
+
+# ---------------------------------------------------------------------
+# Active Backend
+# ---------------------------------------------------------------------
+BACKENDS = {
+    'gemini': GeminiBackend,
+    'fake': FakeBackend.from_env,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Returns the active backend, creating the one named by PERSONA_MODEL_BACKEND (default 'gemini') on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            name = os.getenv("PERSONA_MODEL_BACKEND", "gemini")
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown model backend: {name} (expected one of {', '.join(BACKENDS)})")
+            _backend = BACKENDS[name]()
+        return _backend
+
+def set_backend(backend):
+    """Makes backend the one every agent created from now on uses."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+def create_model(system_instruction=None, model_name=None):
+    """Creates a model on the active backend (model_name defaults to PERSONA_MODEL_NAME or gemini-2.0-flash)."""
+    return get_backend().create_model(model_name or DEFAULT_MODEL_NAME, system_instruction=system_instruction)
@@ -0,0 +1,331 @@
+"""
+Async variants of every agent and stage in persona_core, for serving many
+concurrent simulations from one event loop. Prompts, the bounded conversation
+state and the meeting's turn structure are shared with persona_core. Model
+calls use the SDK's generate_content_async through the same request scheduler,
+response cache and profiler as the sync pipeline. Callbacks run on the event
+loop.
+"""
+import asyncio
+import time
+
+from response_cache import cached_generate_async
+from rate_limiter import estimate_tokens
+from profiler import profile_call, profile_run
+from model_backend import create_model
+from persona_core import (
+    REUSE_SIMILARITY, UPDATE_SIMILARITY, SALES_SYSTEM_INSTRUCTION, ConversationState,
+    _opening_turns, _opening_visible, _round_stages, _round_turns,
+    analysis_prompt, analysis_update_prompt, cold_email_prompt, extract_text, final_pitch_prompt,
+    is_reusable, parse_questions, persona_system_instruction, persona_turn_prompt, questions_prompt,
+    record_usage, refined_analysis_prompt, request_scheduler, review_prompt, sales_turn_prompt,
+)
+from structured_output import (ANALYSIS_CONFIG, ANALYSIS_SECTIONS, QUESTIONS_CONFIG, REFINED_ANALYSIS_CONFIG,
+                               REFINED_ANALYSIS_SECTIONS, stream_sections, structured_text)
+
+# ---------------------------------------------------------------------
+# Async Model Calls
+# ---------------------------------------------------------------------
+async def _call_model(model, prompt, generation_config=None, on_text=None):
+    """Async variant of persona_core._call_model."""
+    async def request():
+        if on_text is None:
+            return await model.generate_content_async(prompt, generation_config=generation_config)
+        response = await model.generate_content_async(prompt, generation_config=generation_config, stream=True)
+        partial_text = ""
+        async for chunk in response:
+            partial_text += extract_text(chunk)
+            on_text(partial_text)
+        return response
+
+    return await request_scheduler.call_async(request, tokens=estimate_tokens(prompt))
+
+async def generate_text(model, prompt, generation_config=None, on_text=None, stage="generate"):
+    """Async variant of persona_core.generate_text (cached, streamed when on_text is given, profiled)."""
+    model_name = getattr(model, 'model_name', str(model))
+    with profile_call(stage, model_name) as usage:
+        usage['cache_hit'] = True
+
+        async def generate():
+            usage['cache_hit'] = False
+            response = await _call_model(model, prompt, generation_config, on_text)
+            return record_usage(usage, response, prompt)
+
+        text = await cached_generate_async(model, prompt, generate, generation_config=generation_config)
+    if on_text and usage['cache_hit']:
+        on_text(text)
+    return text
+
+# ---------------------------------------------------------------------
+# Agents
+# ---------------------------------------------------------------------
+def create_conversation_review_agent():
+    """Returns an async review_conversation(conversation_log, review_focus=None, on_text=None)."""
+    model = create_model()
+
+    async def review_conversation(conversation_log, review_focus=None, on_text=None):
+        prompt = review_prompt(conversation_log, review_focus)
+        return await generate_text(model, prompt, on_text=on_text, stage='conversation_review')
+
+    return review_conversation
+
+async def create_gemini_analysis_agent(person_name, context, on_text=None):
+    """Generates a full personality analysis of the persona."""
+    prompt = analysis_prompt(person_name, context)
+    text = await generate_text(create_model(), prompt, generation_config=ANALYSIS_CONFIG,
+                               on_text=stream_sections(on_text, ANALYSIS_SECTIONS), stage='analysis')
+    return structured_text(text, ANALYSIS_SECTIONS)
+
+async def update_gemini_analysis(person_name, previous_match, context, on_text=None):
+    """Updates a near-duplicate persona's analysis from a diff of the two contexts."""
+    prompt = analysis_update_prompt(person_name, previous_match, context)
+    text = await generate_text(create_model(), prompt, generation_config=ANALYSIS_CONFIG,
+                               on_text=stream_sections(on_text, ANALYSIS_SECTIONS), stage='analysis_update')
+    return structured_text(text, ANALYSIS_SECTIONS)
+
+def _default_index():
+    # Imported here, in a worker thread, so the numpy/scikit-learn import never runs on the event loop
+    from persona_index import get_default_index
+    return get_default_index()
+
+async def get_or_create_analysis(person_name, context, on_text=None, reuse_similarity=REUSE_SIMILARITY,
+                                 update_similarity=UPDATE_SIMILARITY):
+    """
+    Async variant of persona_core.get_or_create_analysis. Index lookups and
+    inserts run in a worker thread so they never block the event loop.
+    """
+    index = await asyncio.to_thread(_default_index)
+    match = await asyncio.to_thread(index.search, context, update_similarity)
+    if is_reusable(match, person_name, reuse_similarity):
+        if on_text:
+            on_text(match['analysis_text'])
+        return match['analysis_text']
+
+    if match:
+        analysis_text = await update_gemini_analysis(person_name, match, context, on_text=on_text)
+    else:
+        analysis_text = await create_gemini_analysis_agent(person_name, context, on_text=on_text)
+    await asyncio.to_thread(index.add, person_name, context, analysis_text)
+    return analysis_text
+
+async def create_persona_agent(person_name, analysis_text=""):
+    """
+    Returns an async generate_response(chat_history, user_input, on_text=None) for the persona.
+    The system instruction is built in a worker thread, since it may compact the analysis with TF-IDF.
+    """
+    system_instruction = await asyncio.to_thread(persona_system_instruction, person_name, analysis_text)
+    model = create_model(system_instruction=system_instruction)
+
+    async def generate_response(chat_history, user_input, on_text=None):
+        prompt = persona_turn_prompt(chat_history, user_input)
+        return await generate_text(model, prompt, on_text=on_text, stage='persona_turn')
+
+    return generate_response
+
+def create_sales_conversation_agent():
+    """Returns an async generate_response(chat_history, user_input, on_text=None) for the BeGig sales agent."""
+    model = create_model(system_instruction=SALES_SYSTEM_INSTRUCTION)
+
+    async def generate_response(chat_history, user_input, on_text=None):
+        prompt = sales_turn_prompt(chat_history, user_input)
+        return await generate_text(model, prompt, on_text=on_text, stage='sales_turn')
+
+    return generate_response
+
+async def generate_dynamic_persona_questions(person_name, conversation_log=""):
+    """Generates the open-ended questions the persona asks in the Q&A rounds."""
+    text_response = await generate_text(create_model(), questions_prompt(person_name, conversation_log),
+                                        generation_config=QUESTIONS_CONFIG, stage='dynamic_questions')
+    return parse_questions(text_response)
+
+async def create_refined_analysis(person_name, conversation_log, on_text=None):
+    """Analyzes the meeting log for communication style, motivations and pitch strategy."""
+    prompt = refined_analysis_prompt(person_name, conversation_log)
+    text = await generate_text(create_model(), prompt, generation_config=REFINED_ANALYSIS_CONFIG,
+                               on_text=stream_sections(on_text, REFINED_ANALYSIS_SECTIONS), stage='refined_analysis')
+    return structured_text(text, REFINED_ANALYSIS_SECTIONS)
+
+async def generate_final_tailored_pitch(refined_analysis_text, conversation_log, on_text=None):
+    """Generates the final tailored pitch from the refined analysis."""
+    # Prompts with compacted inputs are built in a worker thread to keep TF-IDF off the event loop
+    prompt = await asyncio.to_thread(final_pitch_prompt, refined_analysis_text, conversation_log)
+    return await generate_text(create_model(), prompt, on_text=on_text, stage='final_pitch')
+
+async def draft_cold_email(final_pitch, refined_analysis, analysis_text, on_text=None):
+    """Drafts the cold outreach email."""
+    prompt = await asyncio.to_thread(cold_email_prompt, final_pitch, refined_analysis, analysis_text)
+    return await generate_text(create_model(), prompt, on_text=on_text, stage='cold_email')
+
+# ---------------------------------------------------------------------
+# Simulated Conversation
+# ---------------------------------------------------------------------
+async def simulate_meeting_conversation_with_fulltime_preference(persona_agent, sales_agent, persona_name="Unni Koroth",
+                                                                 max_rounds=5, history_window=4, on_turn=None,
+                                                                 pipeline_lag=0, question_agent=None, strategy=None,
+                                                                 opening=None):
+    """
+    Async variant of persona_core.simulate_meeting_conversation_with_fulltime_preference
+    (without the Streamlit banner). Agents are the async agents above.
+    """
+    question_agent = question_agent or generate_dynamic_persona_questions
+    if pipeline_lag > 0:
+        return await _simulate_pipelined(persona_agent, sales_agent, persona_name, max_rounds, history_window,
+                                         on_turn, pipeline_lag, question_agent, strategy, opening)
+
+    conversation = ConversationState(history_window=history_window, turns=list(opening or []))
+
+    async def take_turn(agent, speaker, query):
+        turn_index = len(conversation.turns)
+        on_text = (lambda partial_text: on_turn(turn_index, speaker, partial_text)) if on_turn else None
+        text = await agent(conversation.context(), query, on_text=on_text)
+        conversation.add_turn(speaker, text)
+        return text
+
+    for agent, speaker, query in _opening_turns(persona_agent, sales_agent, persona_name, strategy)[len(conversation.turns):]:
+        await take_turn(agent, speaker, query)
+
+    dynamic_questions = await question_agent(persona_name, conversation.context())
+    rounds = min(max_rounds, len(dynamic_questions))
+
+    for i in range(rounds):
+        for agent, speaker, query in _round_turns(persona_agent, sales_agent, persona_name, i, dynamic_questions[i],
+                                                  strategy):
+            await take_turn(agent, speaker, query)
+
+    return conversation.full_log()
+
+async def _simulate_pipelined(persona_agent, sales_agent, persona_name, max_rounds, history_window, on_turn,
+                              pipeline_lag, question_agent, strategy=None, opening=None):
+    """Async variant of persona_core._simulate_pipelined, with the same turn dependencies."""
+    turns = dict(enumerate(opening or []))
+
+    def context(indices):
+        return ConversationState(history_window=history_window, turns=[turns[j] for j in indices]).context()
+
+    def turn_stage(index, agent, speaker, query, visible):
+        async def run(**_):
+            on_text = (lambda partial_text: on_turn(index, speaker, partial_text)) if on_turn else None
+            text = await agent(context(visible), query, on_text=on_text)
+            turns[index] = (speaker, text)
+            return text
+        return run
+
+    async def questions(**_):
+        return await question_agent(persona_name, context(range(len(opening_turns) - 1)))
+
+    opening_turns = _opening_turns(persona_agent, sales_agent, persona_name, strategy)
+    stages = {}
+    for k, (agent, speaker, query) in enumerate(opening_turns):
+        if k in turns:
+            continue
+        visible = _opening_visible(k)
+        stages[f'turn_{k}'] = (turn_stage(k, agent, speaker, query, visible), [f'turn_{j}' for j in visible if j not in turns])
+    stages['questions'] = (questions, [] if len(opening_turns) - 2 in turns else [f'turn_{len(opening_turns) - 2}'])
+    results, _ = await run_stage_graph(stages)
+
+    dynamic_questions = results['questions']
+    rounds = min(max_rounds, len(dynamic_questions))
+    round_turns = [_round_turns(persona_agent, sales_agent, persona_name, i, dynamic_questions[i], strategy)
+                   for i in range(rounds)]
+    stages = _round_stages(turn_stage, round_turns, len(opening_turns), pipeline_lag)
+    await run_stage_graph(stages)
+
+    return ConversationState(turns=[turns[j] for j in sorted(turns)]).full_log()
+
+# ---------------------------------------------------------------------
+# Stage Scheduler
+# ---------------------------------------------------------------------
+async def _timed_call(func, kwargs):
+    start = time.perf_counter()
+    result = await func(**kwargs)
+    return result, time.perf_counter() - start
+
+async def run_stage_graph(stages, on_stage_complete=None):
+    """
+    Async variant of persona_core.run_stage_graph: each stage is a coroutine
+    function started as a task once its dependencies finish. Tasks inherit the
+    caller's context (priority lane, profile run). If a stage fails, the stages
+    still running are cancelled.
+
+    :param stages: Mapping of stage name to (coroutine function, [dependency stage names])
+    :param on_stage_complete: Optional callback(name, result, elapsed) invoked as each stage finishes
+    :return: Tuple of (results by stage name, elapsed seconds by stage name)
+    """
+    results = {}
+    timings = {}
+    pending = dict(stages)
+    running = {}
+
+    try:
+        while pending or running:
+            for name, (func, deps) in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    kwargs = {dep: results[dep] for dep in deps}
+                    running[asyncio.ensure_future(_timed_call(func, kwargs))] = name
+                    del pending[name]
+
+            if not running:
+                raise ValueError(f"Unresolvable stage dependencies: {', '.join(pending)}")
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                results[name], timings[name] = task.result()
+                if on_stage_complete:
+                    on_stage_complete(name, results[name], timings[name])
+    finally:
+        for task in running:
+            task.cancel()
+
+    return results, timings
+
+# ---------------------------------------------------------------------
+# Full Persona Pipeline
+# ---------------------------------------------------------------------
+async def run_persona_pipeline(person_name, context_text, max_rounds=4, on_stage_complete=None, on_stream=None,
+                               on_turn=None, pipeline_lag=0, reuse_analyses=True, run_id=None):
+    """
+    Async variant of persona_core.run_persona_pipeline with the same stages and
+    dependencies. Callbacks are invoked on the event loop.
+
+    :return: Tuple of (results by stage name, elapsed seconds by stage name)
+    """
+    review_agent = create_conversation_review_agent()
+    analyze = get_or_create_analysis if reuse_analyses else create_gemini_analysis_agent
+
+    def stream(name):
+        return (lambda partial_text: on_stream(name, partial_text)) if on_stream else None
+
+    async def analysis_text():
+        return await analyze(person_name, context_text, on_text=stream('analysis_text'))
+
+    async def conversation_log(analysis_text):
+        persona_agent = await create_persona_agent(person_name, analysis_text=analysis_text)
+        sales_agent = create_sales_conversation_agent()
+        return await simulate_meeting_conversation_with_fulltime_preference(
+            persona_agent, sales_agent, persona_name=person_name, max_rounds=max_rounds, on_turn=on_turn,
+            pipeline_lag=pipeline_lag
+        )
+
+    async def conversation_review(conversation_log):
+        return await review_agent(conversation_log, on_text=stream('conversation_review'))
+
+    async def refined_analysis(conversation_log):
+        return await create_refined_analysis(person_name, conversation_log, on_text=stream('refined_analysis'))
+
+    async def final_pitch(refined_analysis, conversation_log):
+        return await generate_final_tailored_pitch(refined_analysis, conversation_log, on_text=stream('final_pitch'))
+
+    async def cold_email(final_pitch, refined_analysis, analysis_text):
+        return await draft_cold_email(final_pitch, refined_analysis, analysis_text, on_text=stream('cold_email'))
+
+    stages = {
+        'analysis_text': (analysis_text, []),
+        'conversation_log': (conversation_log, ['analysis_text']),
+        'conversation_review': (conversation_review, ['conversation_log']),
+        'refined_analysis': (refined_analysis, ['conversation_log']),
+        'final_pitch': (final_pitch, ['refined_analysis', 'conversation_log']),
+        'cold_email': (cold_email, ['final_pitch', 'refined_analysis', 'analysis_text']),
+    }
+    with profile_run(run_id):
+        return await run_stage_graph(stages, on_stage_complete=on_stage_complete)
@@ -0,0 +1,759 @@
+"""
+UI-free core of the persona pipeline: prompts, agents, the simulated meeting
+and the stage scheduler. Heavy dependencies (the Gemini SDK, the numpy/
+scikit-learn persona index, Streamlit) are imported only when first needed, so
+batch workers and scripts start quickly. PersonaAgent.py is the Streamlit
+front-end on top of this module.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import re
+import os
+import difflib
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from response_cache import cached_generate
+from rate_limiter import RequestScheduler, estimate_tokens
+from profiler import profile_call, profile_run
+from prompt_compaction import compact_input
+from structured_output import (ANALYSIS_CONFIG, ANALYSIS_SECTIONS, QUESTIONS_CONFIG, REFINED_ANALYSIS_CONFIG,
+                               REFINED_ANALYSIS_SECTIONS, REVIEW_SCORE_CONFIG, parse_questions, parse_review_score,
+                               select_sections, stream_sections, structured_text)
+# Models come from a pluggable backend (Gemini by default, or a local fake via PERSONA_MODEL_BACKEND=fake)
+from model_backend import create_model
+
+# ---------------------------------------------------------------------
+# Utility Function to Extract Text
+# ---------------------------------------------------------------------
+def extract_text(response):
+    """Safely extract text from Gemini response."""
+    if hasattr(response, 'text'):
+        return response.text
+    return str(response)
+
+# Shared scheduler every Gemini request goes through (RPM/TPM budgets, priority lanes, retries)
+request_scheduler = RequestScheduler.from_env()
+
+def set_max_concurrent_requests(limit):
+    """Limits how many Gemini requests may be in flight at once across all threads."""
+    request_scheduler.set_max_concurrent(limit)
+
+def _call_model(model, prompt, generation_config=None, on_text=None):
+    """
+    Sends a prompt to the model through the shared request scheduler. When on_text
+    is given the response is streamed and on_text(partial_text) is called with the
+    accumulated text as each chunk arrives (a retry restarts from an empty string).
+    """
+    def request():
+        if on_text is None:
+            return model.generate_content(prompt, generation_config=generation_config)
+        response = model.generate_content(prompt, generation_config=generation_config, stream=True)
+        partial_text = ""
+        for chunk in response:
+            partial_text += extract_text(chunk)
+            on_text(partial_text)
+        return response
+    
+    return request_scheduler.call(request, tokens=estimate_tokens(prompt))
+
+def record_usage(usage, response, prompt):
+    """
+    Fills a profile_call usage dict from the response's usage metadata, falling
+    back to token estimates when the backend does not report it, and returns the
+    response text.
+    """
+    metadata = getattr(response, 'usage_metadata', None)
+    text = extract_text(response)
+    if getattr(metadata, 'prompt_token_count', None) is not None:
+        usage['prompt_tokens'] = metadata.prompt_token_count
+        usage['output_tokens'] = metadata.candidates_token_count or 0
+    else:
+        usage['prompt_tokens'] = estimate_tokens(prompt)
+        usage['output_tokens'] = estimate_tokens(text)
+        usage['estimated'] = True
+    return text
+
+def generate_text(model, prompt, generation_config=None, on_text=None, stage="generate"):
+    """
+    Sends a prompt to the model through the shared response cache and returns its text.
+    Identical (model, prompt, generation_config) requests are served from the cache.
+    If on_text is given, it receives the accumulated text while the response streams
+    (or the full text at once on a cache hit). Every call is profiled under the
+    given stage label (wall time, prompt/output tokens, estimated cost).
+    """
+    model_name = getattr(model, 'model_name', str(model))
+    with profile_call(stage, model_name) as usage:
+        usage['cache_hit'] = True
+        
+        def generate():
+            usage['cache_hit'] = False
+            response = _call_model(model, prompt, generation_config, on_text)
+            return record_usage(usage, response, prompt)
+        
+        text = cached_generate(model, prompt, generate, generation_config=generation_config)
+    if on_text and usage['cache_hit']:
+        on_text(text)
+    return text
+
+# ---------------------------------------------------------------------
+# Conversation Review Agent
+# ---------------------------------------------------------------------
+def create_conversation_review_agent():
+    """
+    Creates an agent that can review and provide insights on the conversation
+    based on the conversation history.
+    """
+    model = create_model()
+    
+    def review_conversation(conversation_log, review_focus=None, on_text=None):
+        """
+        Review the conversation with optional focus areas.
+        
+        :param conversation_log: Full conversation history
+        :param review_focus: Optional specific area to focus on (e.g., 'communication', 'sales strategy')
+        :param on_text: Optional callback receiving the partial review as it streams
+        :return: Detailed review and insights
+        """
+        prompt = review_prompt(conversation_log, review_focus)
+        return generate_text(model, prompt, on_text=on_text, stage='conversation_review')
+    
+    return review_conversation
+
+def review_prompt(conversation_log, review_focus=None):
+    """Builds the conversation review prompt, optionally focused on one area."""
+    prompt = ("You are an advanced conversation analysis AI. Carefully review the following conversation "
+              "and provide a comprehensive analysis. ")
+    
+    if review_focus:
+        prompt += f"Pay special attention to the {review_focus} aspects of the conversation. "
+    
+    prompt += ("\n\nKey areas to analyze:\n"
+               "1. Communication Dynamics\n"
+               "2. Effectiveness of Sales Approach\n"
+               "3. Client's Underlying Needs and Concerns\n"
+               "4. Missed Opportunities\n"
+               "5. Potential Improvements\n\n"
+               f"Conversation Log:\n{conversation_log}\n\n"
+               "Provide a detailed, objective analysis with actionable insights.")
+    return prompt
+
+def score_conversation(conversation_log, review_focus='sales strategy'):
+    """
+    Reviews the conversation like the review agent, but returns a rating of how
+    likely the client is to take a next step with BeGig as (score out of 10 or
+    None, short review summary).
+    """
+    model = create_model()
+    text = generate_text(model, review_score_prompt(conversation_log, review_focus),
+                         generation_config=REVIEW_SCORE_CONFIG, stage='conversation_score')
+    return parse_review_score(text)
+
+def review_score_prompt(conversation_log, review_focus='sales strategy'):
+    """Builds the scored review prompt on top of the review prompt."""
+    return (review_prompt(conversation_log, review_focus) + "\n\n"
+            "Then rate from 1 to 10 how likely the client is to take a next step with BeGig after this conversation. "
+            "Return a JSON object with 'score' (the rating) and 'summary' (two or three sentences justifying it).")
+
+# ---------------------------------------------------------------------
+# Gemini-2.0-Flash for Personality/Behavioral Analysis
+# ---------------------------------------------------------------------
+def create_gemini_analysis_agent(person_name, context, on_text=None):
+    """
+    Creates a specialized Gemini agent to analyze the provided context
+    and generate a comprehensive personality profile.
+    """
+    model = create_model()
+    prompt = analysis_prompt(person_name, context)
+    # The sections come back as schema-constrained JSON and are rendered for display and storage
+    text = generate_text(model, prompt, generation_config=ANALYSIS_CONFIG,
+                         on_text=stream_sections(on_text, ANALYSIS_SECTIONS), stage='analysis')
+    return structured_text(text, ANALYSIS_SECTIONS)
+
+def analysis_prompt(person_name, context):
+    """Builds the full personality analysis prompt."""
+    return (f"You are an advanced personality analysis AI specialized in generating detailed personality insights. "
+            f"Your task is to analyze the provided context for {person_name} and create a comprehensive profile with insights, "
+            "including personality type, traits, communication style, buying preferences, and suggestions for effective engagement.\n\n"
+            "Context:\n{context}\n\n"
+            "Based on the above, generate a structured personality profile with the following sections:\n"
+            "1. Personality Overview\n2. Personality Compatibility\n3. Communication Style\n"
+            "4. Tips for Selling and Engagement\n5. Advanced Insights (DISC, OCEAN, etc.).\n\n"
+            "Return a JSON object with one field per section, in order: "
+            f"{', '.join(key for key, _ in ANALYSIS_SECTIONS)}.").format(person_name=person_name, context=context)
+
+def update_gemini_analysis(person_name, previous_match, context, on_text=None):
+    """
+    Lightly updates the stored analysis of a near-duplicate persona to reflect
+    only the lines that differ between its context and the new context.
+    """
+    model = create_model()
+    prompt = analysis_update_prompt(person_name, previous_match, context)
+    text = generate_text(model, prompt, generation_config=ANALYSIS_CONFIG,
+                         on_text=stream_sections(on_text, ANALYSIS_SECTIONS), stage='analysis_update')
+    return structured_text(text, ANALYSIS_SECTIONS)
+
+def analysis_update_prompt(person_name, previous_match, context):
+    """Builds the prompt that updates a near-duplicate persona's analysis from a diff of the two contexts."""
+    context_changes = "\n".join(difflib.unified_diff(
+        previous_match['context_text'].splitlines(), context.splitlines(), lineterm='', n=0
+    ))
+    return (f"You are an advanced personality analysis AI. Below is a personality profile written for {previous_match['person_name']} "
+            f"from a context that is nearly identical to the current context for {person_name}. "
+            f"Update the profile so it describes {person_name} and reflects the context changes, keeping the same sections. "
+            "If nothing material changed, return the profile unchanged.\n\n"
+            f"Existing Profile:\n{previous_match['analysis_text']}\n\n"
+            f"Context Changes (unified diff; '-' lines removed, '+' lines added):\n{context_changes}\n\n"
+            "Return the updated profile as a JSON object with one field per section: "
+            f"{', '.join(key for key, _ in ANALYSIS_SECTIONS)}.")
+
+REUSE_SIMILARITY = float(os.getenv("PERSONA_REUSE_SIMILARITY", "0.95"))
+UPDATE_SIMILARITY = float(os.getenv("PERSONA_UPDATE_SIMILARITY", "0.8"))
+
+def get_or_create_analysis(person_name, context, on_text=None, reuse_similarity=REUSE_SIMILARITY,
+                           update_similarity=UPDATE_SIMILARITY):
+    """
+    Returns a personality analysis, reusing the persona index where possible:
+    a stored persona with the same name and a context at least reuse_similarity
+    similar is reused as is, one at least update_similarity similar is
+    delta-updated, and anything else gets a full analysis. New analyses are
+    added to the index.
+    """
+    # numpy/scipy/scikit-learn load here rather than when the module is imported
+    from persona_index import get_default_index
+    index = get_default_index()
+    match = index.search(context, threshold=update_similarity)
+    if is_reusable(match, person_name, reuse_similarity):
+        if on_text:
+            on_text(match['analysis_text'])
+        return match['analysis_text']
+    
+    if match:
+        analysis_text = update_gemini_analysis(person_name, match, context, on_text=on_text)
+    else:
+        analysis_text = create_gemini_analysis_agent(person_name, context, on_text=on_text)
+    index.add(person_name, context, analysis_text)
+    return analysis_text
+
+def is_reusable(match, person_name, reuse_similarity=REUSE_SIMILARITY):
+    """Whether an index match is the same persona with a context similar enough to reuse its analysis as is."""
+    return bool(match and match['similarity'] >= reuse_similarity
+                and match['person_name'].strip().lower() == person_name.strip().lower())
+
+# ---------------------------------------------------------------------
+# Persona Agent
+# ---------------------------------------------------------------------
+def create_persona_agent(person_name, analysis_text=""):
+    """
+    Creates a persona agent for 'person_name' that can optionally include
+    the Gemini analysis_text to inform responses about the person's style.
+    """
+    # Static persona context is sent once as the system instruction rather than on every turn
+    model = create_model(system_instruction=persona_system_instruction(person_name, analysis_text))
+    
+    def generate_response(chat_history, user_input, on_text=None):
+        prompt = persona_turn_prompt(chat_history, user_input)
+        return generate_text(model, prompt, on_text=on_text, stage='persona_turn')
+    
+    return generate_response
+
+# Analysis sections each downstream prompt needs; the rest of the profile is left out
+PERSONA_ANALYSIS_FIELDS = ('personality_overview', 'communication_style', 'advanced_insights')
+COLD_EMAIL_ANALYSIS_FIELDS = ('communication_style', 'selling_tips')
+FINAL_PITCH_REFINED_FIELDS = ('communication_style', 'key_motivations', 'pitch_strategy')
+COLD_EMAIL_REFINED_FIELDS = ('key_motivations', 'pitch_strategy')
+
+def persona_system_instruction(person_name, analysis_text=""):
+    """Builds the persona agent's static system instruction."""
+    analysis_text = compact_input('persona_turn', 'analysis_text',
+                                  select_sections(analysis_text, ANALYSIS_SECTIONS, PERSONA_ANALYSIS_FIELDS))
+    return (f"You are an AI version of {person_name}. Below is your personality analysis:\n"
+            f"{analysis_text}\n\n"
+            "You are participating in a virtual meeting with a BeGig sales representative. "
+            "You have reviewed your public content and are ready to share your opinions. "
+            "Keep your responses natural, thoughtful, and reflective of your style, background, and expertise.")
+
+def persona_turn_prompt(chat_history, user_input):
+    """Builds the per-turn persona prompt."""
+    return (f"Meeting Conversation History:\n{chat_history}\n\n"
+            f"Query: {user_input}\n\n"
+            "Response:")
+
+# ---------------------------------------------------------------------
+# Sales Conversation Agent
+# ---------------------------------------------------------------------
+def create_sales_conversation_agent():
+    """
+    Sales agent representing BeGig, explaining the value proposition to the persona.
+    """
+    model = create_model(system_instruction=SALES_SYSTEM_INSTRUCTION)
+    
+    def generate_response(chat_history, user_input, on_text=None):
+        prompt = sales_turn_prompt(chat_history, user_input)
+        return generate_text(model, prompt, on_text=on_text, stage='sales_turn')
+    
+    return generate_response
+
+SALES_SYSTEM_INSTRUCTION = (
+    "You are a sales expert representing BeGig using the Gemini 2.0 Flash model. You are in a virtual meeting with the client. "
+    "Your goal is to clearly and persuasively explain BeGig's value proposition while being sensitive to the client's preferences. "
+    "Keep in mind that the client typically prefers full-time employees but may be open to hearing how flexible solutions can also benefit them."
+)
+
+def sales_turn_prompt(chat_history, user_input):
+    """Builds the per-turn sales prompt."""
+    return (f"Meeting Conversation History:\n{chat_history}\n\n"
+            f"Sales Query: {user_input}\n\n"
+            "Sales Response:")
+
+# ---------------------------------------------------------------------
+# Dynamic Persona Questions
+# ---------------------------------------------------------------------
+def generate_dynamic_persona_questions(person_name, conversation_log=""):
+    """
+    Generates dynamic, curiosity-driven, reflective, and open-ended questions for the persona
+    to inquire about deeper aspects of BeGig's offerings.
+    """
+    model = create_model()
+    prompt = questions_prompt(person_name, conversation_log)
+    text_response = generate_text(model, prompt, generation_config=QUESTIONS_CONFIG, stage='dynamic_questions')
+    return parse_questions(text_response)
+
+def questions_prompt(person_name, conversation_log=""):
+    """Builds the dynamic persona questions prompt."""
+    return ("You are an insightful AI that helps generate dynamic, curiosity-driven, and reflective questions for a persona in a virtual meeting. "
+            f"Based on the persona name '{person_name}' and the following conversation context:\n\n"
+            f"{conversation_log}\n\n"
+            f"Generate 3 to 5 open-ended questions that {person_name} might ask to gain deeper insights about BeGig's offerings. "
+            "Focus on topics such as talent matching, how flexible hires can transition to full-time roles, compliance across markets, and success stories. "
+            "Each question should be clear and engaging. "
+            "Return a JSON object whose 'questions' field lists the questions, each a single sentence ending in a question mark.")
+
+# ---------------------------------------------------------------------
+# Conversation State
+# ---------------------------------------------------------------------
+class ConversationState:
+    """
+    Turn-based record of a simulated meeting. Agents receive a bounded context
+    (a short digest of older turns plus the last few turns verbatim), so the
+    per-turn prompt stays roughly flat as the meeting grows, while the full
+    log is still available for the downstream analysis stages.
+    """
+    
+    def __init__(self, history_window=4, summary_chars=1500, digest_chars=200, turns=None):
+        """
+        :param history_window: Number of most recent turns passed to agents verbatim
+        :param summary_chars: Maximum size of the digest of older turns
+        :param digest_chars: Maximum size of each older turn's digest line
+        :param turns: Optional initial list of (speaker, text) turns
+        """
+        self.history_window = history_window
+        self.summary_chars = summary_chars
+        self.digest_chars = digest_chars
+        self.turns = list(turns or [])
+    
+    def add_turn(self, speaker, text):
+        self.turns.append((speaker, text))
+    
+    def _digest(self, speaker, text):
+        """Reduces an older turn to its first sentence."""
+        first_sentence = re.split(r'(?<=[.!?])\s+', text.strip(), maxsplit=1)[0]
+        return f"- {speaker}: {first_sentence[:self.digest_chars]}"
+    
+    def context(self):
+        """Returns the bounded history string passed to the agents."""
+        older = self.turns[:-self.history_window] if self.history_window else self.turns
+        recent = self.turns[len(older):]
+        
+        context = "Meeting Conversation Start:\n"
+        if older:
+            digest_lines = [self._digest(speaker, text) for speaker, text in older]
+            # Keep the most recent digest lines that fit the summary budget
+            summary, size = [], 0
+            for line in reversed(digest_lines):
+                size += len(line) + 1
+                if size > self.summary_chars:
+                    break
+                summary.insert(0, line)
+            context += "\nEarlier in the meeting (summary):\n" + "\n".join(summary) + "\n\nRecent turns:\n"
+        for speaker, text in recent:
+            context += f"\n{speaker}: {text}\n"
+        return context
+    
+    def full_log(self):
+        """Returns the complete conversation log."""
+        log = "Meeting Conversation Start:\n"
+        for speaker, text in self.turns:
+            log += f"\n{speaker}: {text}\n"
+        return log
+
+# ---------------------------------------------------------------------
+# Simulated Conversation with Dynamic Flow
+# ---------------------------------------------------------------------
+SALES_SPEAKER = "BeGig Sales"
+
+# How the sales agent handles the full-time objection and which scenario each Q&A
+# round's answer draws on (the last scenario repeats for any further rounds)
+DEFAULT_STRATEGY = {
+    'name': 'hybrid_transition',
+    'objection_handling': (
+        "Based on the client's preference for full-time hires, please provide an objection handling message "
+        "that explains how BeGig's hybrid solution can start with flexible hires that eventually transition to full-time roles. "
+        "Also, ask about the challenges the client faces with their current full-time hiring process."
+    ),
+    'scenarios': ('ai_matching', 'success_story', 'compliance', 'success_story'),
+}
+
+# Greeting and preference turns, which do not depend on the sales strategy
+SHARED_OPENING_TURNS = 3
+
+def _opening_turns(persona_agent, sales_agent, persona_name, strategy=None):
+    """Returns the scripted opening turns as (agent, speaker, query) tuples."""
+    strategy = strategy or DEFAULT_STRATEGY
+    return [
+        # Persona greeting
+        (persona_agent, persona_name,
+         "Please provide a friendly greeting, introducing yourself and your role."),
+        # Sales agent greeting
+        (sales_agent, SALES_SPEAKER,
+         "Please greet the client warmly and ask about their biggest challenge in scaling their team."),
+        # Persona states full-time hiring preference
+        (persona_agent, persona_name,
+         "Please state your preference for full-time employees over freelancers, and explain why full-time hires offer more stability for your projects."),
+        # Sales agent objection handling and synergy exploration
+        (sales_agent, SALES_SPEAKER, strategy['objection_handling']),
+    ]
+
+def _round_turns(persona_agent, sales_agent, persona_name, round_index, persona_question, strategy=None):
+    """Returns one dynamic Q&A round (persona question, sales answer) as (agent, speaker, query) tuples."""
+    # Sales dynamic response with a changing scenario
+    scenarios = (strategy or DEFAULT_STRATEGY)['scenarios']
+    scenario = scenarios[min(round_index, len(scenarios) - 1)]
+    sales_query = f"Based on the conversation so far, please address the following question dynamically: '{persona_question}'. Provide an answer related to {scenario}."
+    return [
+        (persona_agent, persona_name, persona_question),
+        (sales_agent, SALES_SPEAKER, sales_query),
+    ]
+
+def simulate_meeting_conversation_with_fulltime_preference(persona_agent, sales_agent, persona_name="Unni Koroth", max_rounds=5,
+                                                           show_banner=True, history_window=4, on_turn=None,
+                                                           pipeline_lag=0, question_agent=None, strategy=None, opening=None):
+    """
+    Simulates a conversation between the persona and sales agent.
+    The conversation includes dynamic greetings, preference statements, and interactive Q&A.
+    Agents see a bounded history (see ConversationState); the full log is returned.
+    Set show_banner=False when running outside the Streamlit script thread.
+    If on_turn is given, on_turn(turn_index, speaker, partial_text) is called as each turn streams in.
+    
+    With pipeline_lag > 0 the meeting runs in pipelined mode (see _simulate_pipelined),
+    trading some conversational coherence for a shorter wall-clock time.
+    question_agent(persona_name, conversation_log) defaults to generate_dynamic_persona_questions.
+    strategy (see DEFAULT_STRATEGY) sets the objection handling and the scenario of each round.
+    opening is an optional list of (speaker, text) opening turns already taken (see simulate_opening),
+    which are reused instead of regenerated.
+    """
+    question_agent = question_agent or generate_dynamic_persona_questions
+    if show_banner:
+        import streamlit as st
+        st.info(f"--- Virtual Meeting Begins: {persona_name} with BeGig Sales ---")
+    if pipeline_lag > 0:
+        return _simulate_pipelined(persona_agent, sales_agent, persona_name, max_rounds, history_window,
+                                   on_turn, pipeline_lag, question_agent, strategy, opening)
+    
+    conversation = ConversationState(history_window=history_window, turns=list(opening or []))
+    
+    def take_turn(agent, speaker, query):
+        turn_index = len(conversation.turns)
+        on_text = (lambda partial_text: on_turn(turn_index, speaker, partial_text)) if on_turn else None
+        text = agent(conversation.context(), query, on_text=on_text)
+        conversation.add_turn(speaker, text)
+        return text
+    
+    for agent, speaker, query in _opening_turns(persona_agent, sales_agent, persona_name, strategy)[len(conversation.turns):]:
+        take_turn(agent, speaker, query)
+    
+    # Generate dynamic questions and responses
+    dynamic_questions = question_agent(persona_name, conversation.context())
+    rounds = min(max_rounds, len(dynamic_questions))
+    
+    for i in range(rounds):
+        for agent, speaker, query in _round_turns(persona_agent, sales_agent, persona_name, i, dynamic_questions[i],
+                                                  strategy):
+            take_turn(agent, speaker, query)
+    
+    return conversation.full_log()
+
+def simulate_opening(persona_agent, sales_agent, persona_name, turns=SHARED_OPENING_TURNS, history_window=4):
+    """
+    Takes the first opening turns (by default the greetings and the persona's
+    full-time preference, which no sales strategy affects) and returns them as
+    (speaker, text) pairs that meetings can share through their opening argument.
+    """
+    conversation = ConversationState(history_window=history_window)
+    for agent, speaker, query in _opening_turns(persona_agent, sales_agent, persona_name)[:turns]:
+        conversation.add_turn(speaker, agent(conversation.context(), query))
+    return conversation.turns
+
+def _opening_visible(k):
+    """Opening turns that opening turn k sees in pipelined mode (the sales greeting skips the persona greeting)."""
+    return range(k - 1) if k == 1 else range(k)
+
+def _round_anchor(base, round_index, pipeline_lag):
+    """
+    Index of the last turn a pipelined Q&A round waits for: the previous sales
+    answer when serial, or the one pipeline_lag rounds earlier (at least the
+    last opening turn, base - 1).
+    """
+    return max(base - 1, base + 2 * (round_index - pipeline_lag) - 1)
+
+def _round_stages(turn_stage, round_turns, base, pipeline_lag):
+    """
+    Builds the stage graph of the pipelined Q&A rounds, shared by the sync and
+    async simulations. round_turns[i] is round i's pair of (agent, speaker,
+    query) turns and turn_stage(index, agent, speaker, query, visible) makes a
+    turn's stage function. A turn sees every turn up to its round's anchor plus,
+    for the sales answer, the persona turn before it, and depends on each of
+    those Q&A turns (opening turns have already landed), so its context is
+    complete when it starts.
+    """
+    stages = {}
+    for i, turns in enumerate(round_turns):
+        visible = list(range(_round_anchor(base, i, pipeline_lag) + 1))
+        for offset, (agent, speaker, query) in enumerate(turns):
+            index = base + 2 * i + offset
+            stages[f'turn_{index}'] = (turn_stage(index, agent, speaker, query, list(visible)),
+                                       [f'turn_{j}' for j in visible if j >= base])
+            visible.append(index)
+    return stages
+
+def _simulate_pipelined(persona_agent, sales_agent, persona_name, max_rounds, history_window, on_turn,
+                        pipeline_lag, question_agent, strategy=None, opening=None):
+    """
+    Pipelined variant of the simulated meeting. The persona and sales greetings run
+    together, question generation starts off the partial log (before the
+    objection-handling turn lands), and in each Q&A round the
+    persona and sales turns may run up to pipeline_lag rounds ahead of the sales
+    answers they would normally wait for. Turns that run concurrently do not see each
+    other. The log is reassembled in canonical turn order once every turn lands, so
+    the result has the same shape as a serial run. Turns given in opening are not rerun.
+    """
+    turns = dict(enumerate(opening or []))
+    
+    def context(indices):
+        return ConversationState(history_window=history_window, turns=[turns[j] for j in indices]).context()
+    
+    def turn_stage(index, agent, speaker, query, visible):
+        def run(**_):
+            on_text = (lambda partial_text: on_turn(index, speaker, partial_text)) if on_turn else None
+            text = agent(context(visible), query, on_text=on_text)
+            turns[index] = (speaker, text)
+            return text
+        return run
+    
+    # The two greetings run together, the preference and objection turns stay serial,
+    # and questions are generated alongside the objection turn
+    opening_turns = _opening_turns(persona_agent, sales_agent, persona_name, strategy)
+    stages = {}
+    for k, (agent, speaker, query) in enumerate(opening_turns):
+        if k in turns:
+            continue
+        visible = _opening_visible(k)
+        deps = [f'turn_{j}' for j in visible if j not in turns]
+        stages[f'turn_{k}'] = (turn_stage(k, agent, speaker, query, visible), deps)
+    question_deps = [] if len(opening_turns) - 2 in turns else [f'turn_{len(opening_turns) - 2}']
+    stages['questions'] = (lambda **_: question_agent(persona_name, context(range(len(opening_turns) - 1))),
+                           question_deps)
+    results, _ = run_stage_graph(stages)
+    
+    dynamic_questions = results['questions']
+    rounds = min(max_rounds, len(dynamic_questions))
+    round_turns = [_round_turns(persona_agent, sales_agent, persona_name, i, dynamic_questions[i], strategy)
+                   for i in range(rounds)]
+    stages = _round_stages(turn_stage, round_turns, len(opening_turns), pipeline_lag)
+    run_stage_graph(stages, max_workers=max(1, 2 * min(rounds, pipeline_lag + 1)))
+    
+    return ConversationState(turns=[turns[j] for j in sorted(turns)]).full_log()
+
+# ---------------------------------------------------------------------
+# Refined Analysis & Final Tailored Pitch
+# ---------------------------------------------------------------------
+def create_refined_analysis(person_name, conversation_log, on_text=None):
+    """
+    Analyzes the conversation log to extract behavioral cues, communication style,
+    and decision-making preferences.
+    """
+    model = create_model()
+    prompt = refined_analysis_prompt(person_name, conversation_log)
+    text = generate_text(model, prompt, generation_config=REFINED_ANALYSIS_CONFIG,
+                         on_text=stream_sections(on_text, REFINED_ANALYSIS_SECTIONS), stage='refined_analysis')
+    return structured_text(text, REFINED_ANALYSIS_SECTIONS)
+
+def refined_analysis_prompt(person_name, conversation_log):
+    """Builds the refined analysis prompt from the meeting log."""
+    return (f"You are an AI analyst who has observed a virtual meeting conversation with {person_name}, a potential client. "
+            "Based on the conversation history, analyze their communication style, personality traits, and behavioral cues. "
+            "Then, provide a summary of their style and suggest the best way to pitch BeGig to them, keeping in mind their preference "
+            "for full-time hires and overall strategic goals.\n\n"
+            f"Meeting Conversation History:\n{conversation_log}\n\n"
+            "Provide a detailed analysis focusing on communication style, key motivations, and tailored pitch strategies. "
+            "Return a JSON object with one field per section: "
+            f"{', '.join(key for key, _ in REFINED_ANALYSIS_SECTIONS)}.")
+
+def generate_final_tailored_pitch(refined_analysis_text, conversation_log, on_text=None):
+    """
+    Uses the refined analysis to generate a final tailored sales pitch for BeGig.
+    """
+    model = create_model()
+    prompt = final_pitch_prompt(refined_analysis_text, conversation_log)
+    return generate_text(model, prompt, on_text=on_text, stage='final_pitch')
+
+def final_pitch_prompt(refined_analysis_text, conversation_log):
+    """Builds the final tailored pitch prompt."""
+    refined_analysis_text = compact_input('final_pitch', 'refined_analysis', select_sections(
+        refined_analysis_text, REFINED_ANALYSIS_SECTIONS, FINAL_PITCH_REFINED_FIELDS))
+    # Favour the turns that bear on the pitch strategy when the log is over budget
+    conversation_log = compact_input('final_pitch', 'conversation_log', conversation_log, query=refined_analysis_text)
+    return ("Based on the following refined analysis and conversation history, create a final, tailored sales pitch "
+            "that addresses the client's specific needs, communication style, and potential concerns:\n\n"
+            f"Refined Analysis:\n{refined_analysis_text}\n\n"
+            f"Conversation History:\n{conversation_log}\n\n"
+            "Craft a compelling, personalized pitch that highlights how BeGig can solve their specific challenges.")
+
+# ---------------------------------------------------------------------
+# Cold Email Drafting
+# ---------------------------------------------------------------------
+def draft_cold_email(final_pitch, refined_analysis, analysis_text, on_text=None):
+    """
+    Uses the final tailored pitch, refined analysis, and detailed personality analysis
+    to draft a cold email.
+    """
+    model = create_model()
+    prompt = cold_email_prompt(final_pitch, refined_analysis, analysis_text)
+    return generate_text(model, prompt, on_text=on_text, stage='cold_email')
+
+def cold_email_prompt(final_pitch, refined_analysis, analysis_text):
+    """Builds the cold email prompt."""
+    analysis_text = compact_input('cold_email', 'analysis_text',
+                                  select_sections(analysis_text, ANALYSIS_SECTIONS, COLD_EMAIL_ANALYSIS_FIELDS))
+    refined_analysis = compact_input('cold_email', 'refined_analysis',
+                                     select_sections(refined_analysis, REFINED_ANALYSIS_SECTIONS, COLD_EMAIL_REFINED_FIELDS))
+    final_pitch = compact_input('cold_email', 'final_pitch', final_pitch)
+    return ("You are a sales expert crafting a cold email to a prospective client. "
+            "Even though no meeting has taken place, you have in-depth insights about the client's personality, "
+            "communication style, and business needs derived from detailed analysis. Use the following insights to draft a compelling email:\n\n"
+            f"Detailed Personality Analysis:\n{analysis_text}\n\n"
+            f"Refined Analysis & Pitch Strategy:\n{refined_analysis}\n\n"
+            f"Final Tailored Pitch:\n{final_pitch}\n\n"
+            "Draft a cold email that introduces yourself, explains why you believe the client would benefit from BeGig's solution, "
+            "and invites them for a discussion. Do not reference any prior meeting or conversation—present it as a genuine cold outreach email. "
+            "Ensure the tone is professional, insightful, and engaging.")
+
+# ---------------------------------------------------------------------
+# Stage Scheduler
+# ---------------------------------------------------------------------
+def _timed_call(func, kwargs):
+    """Runs a stage callable and returns its result with the elapsed wall time."""
+    start = time.perf_counter()
+    result = func(**kwargs)
+    return result, time.perf_counter() - start
+
+def run_stage_graph(stages, on_stage_complete=None, max_workers=4, on_poll=None, poll_interval=0.1):
+    """
+    Runs a dependency graph of pipeline stages, executing independent stages
+    concurrently on a thread pool.
+    
+    :param stages: Mapping of stage name to (callable, [dependency stage names]).
+                   Each callable receives its dependencies' results as keyword arguments.
+    :param on_stage_complete: Optional callback(name, result, elapsed) invoked in the
+                              calling thread as soon as each stage finishes
+    :param max_workers: Maximum number of stages running at once
+    :param on_poll: Optional callback invoked in the calling thread every poll_interval
+                    seconds while stages run (e.g. to render streamed progress)
+    :return: Tuple of (results by stage name, elapsed seconds by stage name)
+    """
+    results = {}
+    timings = {}
+    pending = dict(stages)
+    running = {}
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # Submit every stage whose dependencies have all finished
+            for name, (func, deps) in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    kwargs = {dep: results[dep] for dep in deps}
+                    # Copy the caller's context so stages inherit its request priority lane
+                    ctx = contextvars.copy_context()
+                    running[executor.submit(ctx.run, _timed_call, func, kwargs)] = name
+                    del pending[name]
+            
+            if not running:
+                raise ValueError(f"Unresolvable stage dependencies: {', '.join(pending)}")
+            
+            done, _ = wait(running, timeout=poll_interval if on_poll else None, return_when=FIRST_COMPLETED)
+            if on_poll:
+                on_poll()
+            for future in done:
+                name = running.pop(future)
+                results[name], timings[name] = future.result()
+                if on_stage_complete:
+                    on_stage_complete(name, results[name], timings[name])
+    
+    return results, timings
+
+# ---------------------------------------------------------------------
+# Full Persona Pipeline
+# ---------------------------------------------------------------------
+def run_persona_pipeline(person_name, context_text, max_rounds=4, on_stage_complete=None, show_banner=False,
+                         on_stream=None, on_turn=None, on_poll=None, pipeline_lag=0, reuse_analyses=True, run_id=None):
+    """
+    Runs every stage for one persona as a dependency graph:
+    analysis -> simulation -> (review || refined analysis -> pitch -> cold email).
+    
+    :param person_name: Name of the persona
+    :param context_text: Background context used for the personality analysis
+    :param max_rounds: Maximum number of dynamic Q&A rounds in the simulated meeting
+    :param on_stage_complete: Optional callback(name, result, elapsed) invoked as each stage finishes
+    :param show_banner: Whether the simulation posts its Streamlit banner
+    :param on_stream: Optional callback(stage_name, partial_text) called from worker threads as
+                      single-response stages stream
+    :param on_turn: Optional callback(turn_index, speaker, partial_text) called from worker threads
+                    as meeting turns stream
+    :param on_poll: Optional callback invoked periodically in the calling thread (see run_stage_graph)
+    :param pipeline_lag: Rounds the simulated meeting may run ahead (0 = serial, see _simulate_pipelined)
+    :param reuse_analyses: Whether to reuse analyses of near-duplicate personas (see get_or_create_analysis)
+    :param run_id: Optional id every model call of this run is profiled under (see profiler.profile_run)
+    :return: Tuple of (results by stage name, elapsed seconds by stage name)
+    """
+    review_agent = create_conversation_review_agent()
+    analyze = get_or_create_analysis if reuse_analyses else create_gemini_analysis_agent
+    
+    def stream(name):
+        return (lambda partial_text: on_stream(name, partial_text)) if on_stream else None
+    
+    def simulate(analysis_text):
+        persona_agent = create_persona_agent(person_name, analysis_text=analysis_text)
+        sales_agent = create_sales_conversation_agent()
+        return simulate_meeting_conversation_with_fulltime_preference(
+            persona_agent, sales_agent, persona_name=person_name, max_rounds=max_rounds, show_banner=show_banner,
+            on_turn=on_turn, pipeline_lag=pipeline_lag
+        )
+    
+    stages = {
+        'analysis_text': (lambda: analyze(person_name, context_text, on_text=stream('analysis_text')), []),
+        'conversation_log': (simulate, ['analysis_text']),
+        'conversation_review': (lambda conversation_log: review_agent(conversation_log, on_text=stream('conversation_review')),
+                                ['conversation_log']),
+        'refined_analysis': (lambda conversation_log: create_refined_analysis(person_name, conversation_log,
+                                                                              on_text=stream('refined_analysis')),
+                             ['conversation_log']),
+        'final_pitch': (lambda refined_analysis, conversation_log: generate_final_tailored_pitch(
+                            refined_analysis, conversation_log, on_text=stream('final_pitch')),
+                        ['refined_analysis', 'conversation_log']),
+        'cold_email': (lambda final_pitch, refined_analysis, analysis_text: draft_cold_email(
+                           final_pitch, refined_analysis, analysis_text, on_text=stream('cold_email')),
+                       ['final_pitch', 'refined_analysis', 'analysis_text']),
+    }
+    with profile_run(run_id):
+        return run_stage_graph(stages, on_stage_complete=on_stage_complete, on_poll=on_poll)
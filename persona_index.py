@@ -0,0 +1,224 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# ---------------------------------------------------------------------
+# TF-IDF Persona Similarity Index
+# ---------------------------------------------------------------------
+DEFAULT_INDEX_PATH = os.getenv("PERSONA_INDEX_PATH", ".persona_index.sqlite3")
+N_FEATURES = 2 ** 20
+
+def context_hash(context_text):
+    """Returns a stable hash of the persona context used for exact-match lookups."""
+    return hashlib.sha256(context_text.strip().encode('utf-8')).hexdigest()
+
+def _row_similarities(rows, query):
+    """
+    Cosine similarity of each L2-normalized row of a CSR matrix with an
+    L2-normalized 1-row query, matching sorted term indices directly instead of
+    transposing the 2**20-column query as a generic sparse product would.
+    """
+    if rows.nnz == 0:
+        return np.zeros(rows.shape[0])
+    positions = np.searchsorted(query.indices, rows.indices).clip(max=len(query.indices) - 1)
+    matched = query.indices[positions] == rows.indices
+    products = np.where(matched, rows.data * query.data[positions], 0.0)
+    # reduceat needs a valid offset per row; empty rows are zeroed afterwards
+    starts = rows.indptr[:-1].clip(max=rows.nnz - 1)
+    scores = np.add.reduceat(products, starts)
+    scores[np.diff(rows.indptr) == 0] = 0.0
+    return scores
+
+class PersonaIndex:
+    """
+    Incremental TF-IDF index over persona contexts, persisted in SQLite.
+
+    Term counts come from a HashingVectorizer, so no vocabulary has to be refit
+    as personas are added. Document frequencies are updated incrementally, and
+    each persona is stored as a sparse, L2-normalized TF-IDF signature over a
+    fixed-size sample of its terms. A lookup scores every stored persona on the
+    query's few highest-weight (rarest) terms through a column-major copy of
+    the matrix, then rescores the best candidates with exact cosine similarity.
+    The cost depends on the posting lengths of rare terms, not on how many
+    personas are stored. Signatures are weighted with the IDF at the time they
+    are added and re-weighted with the current IDF when the index is loaded.
+    """
+
+    def __init__(self, db_path=DEFAULT_INDEX_PATH, max_terms=128, query_terms=16, candidates=8, rebuild_every=256):
+        """
+        :param db_path: SQLite file holding stored personas, or None for memory only
+        :param max_terms: Strongest terms kept per persona signature
+        :param query_terms: Highest-weight query terms used to gather candidates
+        :param candidates: Candidates rescored with exact cosine similarity
+        :param rebuild_every: Newly added personas scanned directly before they are merged into the column index
+        """
+        self.max_terms = max_terms
+        self.query_terms = query_terms
+        self.candidates = candidates
+        self.rebuild_every = rebuild_every
+        self._vectorizer = HashingVectorizer(
+            n_features=N_FEATURES, alternate_sign=False, norm=None, ngram_range=(1, 2), stop_words='english'
+        )
+        self._lock = threading.Lock()
+        self._df = np.zeros(N_FEATURES, dtype=np.int32)
+        self._ids = []
+        self._matrix = sp.csr_matrix((0, N_FEATURES), dtype=np.float32)
+        self._columns = self._matrix.tocsc()
+        self._pending = []
+        self._pending_matrix = None
+
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS personas ("
+            "id INTEGER PRIMARY KEY, person_name TEXT NOT NULL, context_hash TEXT NOT NULL, "
+            "context_text TEXT NOT NULL, analysis_text TEXT NOT NULL, "
+            "term_indices BLOB NOT NULL, term_counts BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS personas_context_hash ON personas (context_hash)")
+        self._db.commit()
+        self._load()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _term_counts(self, text):
+        """Returns (indices, counts) of the hashed unigram/bigram term counts of text."""
+        row = self._vectorizer.transform([text])
+        return row.indices.astype(np.int32), row.data.astype(np.float32)
+
+    def _signature(self, indices, counts):
+        """
+        Builds a 1 x N_FEATURES L2-normalized TF-IDF row over a bottom-k sample of the
+        terms. Hashed term indices are uniformly distributed, so keeping the max_terms
+        smallest indices samples the same terms from every document; near-duplicates
+        keep nearly identical samples no matter how IDF shifts over time.
+        """
+        order = np.argsort(indices)[:self.max_terms]
+        indices, counts = indices[order], counts[order]
+        idf = np.log((1.0 + len(self._ids)) / (1.0 + self._df[indices])) + 1.0
+        weights = ((1.0 + np.log(counts)) * idf).astype(np.float32)
+        norm = np.linalg.norm(weights)
+        if norm > 0:
+            weights = weights / norm
+        return sp.csr_matrix((weights, indices, [0, len(indices)]), shape=(1, N_FEATURES))
+
+    def _load(self):
+        rows = self._db.execute("SELECT id, term_indices, term_counts FROM personas ORDER BY id").fetchall()
+        term_counts = []
+        for row_id, indices, counts in rows:
+            indices = np.frombuffer(indices, dtype=np.int32)
+            self._ids.append(row_id)
+            self._df[indices] += 1
+            term_counts.append((indices, np.frombuffer(counts, dtype=np.float32)))
+        # Weight every signature with the IDF of the full stored collection
+        if term_counts:
+            self._matrix = sp.vstack([self._signature(*counts) for counts in term_counts], format='csr')
+            self._columns = self._matrix.tocsc()
+
+    def _merge_pending(self):
+        """Appends recently added signatures to the matrix and rebuilds the column index."""
+        self._matrix = sp.vstack([self._matrix] + self._pending, format='csr')
+        self._columns = self._matrix.tocsc()
+        self._pending = []
+        self._pending_matrix = None
+
+    def add(self, person_name, context_text, analysis_text):
+        """Stores a persona's context and analysis and makes it searchable."""
+        indices, counts = self._term_counts(context_text)
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO personas (person_name, context_hash, context_text, analysis_text, "
+                "term_indices, term_counts, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (person_name, context_hash(context_text), context_text, analysis_text,
+                 indices.tobytes(), counts.tobytes(), time.time())
+            )
+            self._db.commit()
+            self._ids.append(cursor.lastrowid)
+            self._df[indices] += 1
+            self._pending.append(self._signature(indices, counts))
+            self._pending_matrix = None
+            if len(self._pending) >= self.rebuild_every:
+                self._merge_pending()
+
+    def _fetch(self, row_id, similarity):
+        person_name, context_text, analysis_text = self._db.execute(
+            "SELECT person_name, context_text, analysis_text FROM personas WHERE id = ?", (row_id,)
+        ).fetchone()
+        return {
+            'person_name': person_name,
+            'context_text': context_text,
+            'analysis_text': analysis_text,
+            'similarity': similarity,
+        }
+
+    def search(self, context_text, threshold=0.0):
+        """
+        Finds the stored persona whose context is most similar to context_text.
+
+        :param context_text: Context of the incoming persona
+        :param threshold: Minimum cosine similarity for a match
+        :return: Dict with person_name, context_text, analysis_text and similarity, or None
+        """
+        with self._lock:
+            if not self._ids:
+                return None
+
+            exact = self._db.execute(
+                "SELECT id FROM personas WHERE context_hash = ? ORDER BY id DESC LIMIT 1",
+                (context_hash(context_text),)
+            ).fetchone()
+            if exact:
+                return self._fetch(exact[0], 1.0)
+
+            query = self._signature(*self._term_counts(context_text))
+            if query.nnz == 0:
+                return None
+            best_row, best_score = None, 0.0
+
+            # Gather candidates from the postings of the rarest query terms, then rescore exactly
+            built = self._matrix.shape[0]
+            if built:
+                top = np.argsort(query.data)[-self.query_terms:]
+                terms, term_weights = query.indices[top], query.data[top]
+                starts, ends = self._columns.indptr[terms], self._columns.indptr[terms + 1]
+                if ends.sum() > starts.sum():
+                    rows = np.concatenate([self._columns.indices[a:b] for a, b in zip(starts, ends)])
+                    contributions = np.concatenate([self._columns.data[a:b] for a, b in zip(starts, ends)])
+                    contributions *= np.repeat(term_weights, ends - starts)
+                    rows, position = np.unique(rows, return_inverse=True)
+                    partial = np.bincount(position, weights=contributions)
+                    count = min(self.candidates, len(rows))
+                    candidates = rows[np.argpartition(partial, -count)[-count:]]
+                    scores = _row_similarities(self._matrix[candidates], query)
+                    best = int(np.argmax(scores))
+                    best_row, best_score = int(candidates[best]), float(scores[best])
+
+            # Personas added since the last rebuild are scanned directly
+            if self._pending:
+                if self._pending_matrix is None:
+                    self._pending_matrix = sp.vstack(self._pending, format='csr')
+                scores = _row_similarities(self._pending_matrix, query)
+                best = int(np.argmax(scores))
+                if scores[best] > best_score:
+                    best_row, best_score = built + best, float(scores[best])
+
+            if best_row is None or best_score < threshold:
+                return None
+            return self._fetch(self._ids[best_row], best_score)
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+def get_default_index():
+    """Returns the process-wide persona index, loading it on first use."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = PersonaIndex()
+        return _default_index
@@ -0,0 +1,230 @@
+"""
+Lightweight HTTP/JSON service that runs whole persona simulations as
+background jobs. All jobs share one asyncio event loop and the async pipeline
+(persona_async), so a single process can keep hundreds of simulations in
+flight. Finished runs are saved to the conversation record store.
+
+Endpoints:
+    POST /jobs        {"name": ..., "context": ..., "max_rounds": 4, "pipeline_lag": 0, "reuse_analyses": true}
+                      -> 202 {"id": ..., "status": "queued", ...}
+    GET  /jobs/<id>   -> status (queued, running, done or error), finished stages with
+                         timings, and the stage results once done
+    GET  /jobs        -> summaries of recent jobs, newest first
+    GET  /metrics     -> Prometheus metrics of model calls
+    GET  /healthz
+
+Usage:
+    python persona_service.py --port 8080 --max-running 200
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import persona_async
+import persona_core
+import persona_index
+import prompt_compaction
+from profiler import default_profiler
+from record_store import get_default_store
+
+MAX_BODY_BYTES = 1 << 20
+
+# ---------------------------------------------------------------------
+# Job Manager
+# ---------------------------------------------------------------------
+class JobManager:
+    """
+    Runs simulation jobs on a dedicated event loop thread and keeps their status
+    in memory. At most max_running jobs run at once; the rest wait in order.
+    Only the newest max_jobs jobs are kept, and unfinished jobs are never dropped.
+    """
+
+    def __init__(self, max_running=200, max_jobs=1000, save_records=True):
+        """
+        :param max_running: Jobs allowed to run concurrently
+        :param max_jobs: Jobs kept for status polling
+        :param save_records: Whether finished runs are added to the conversation record store
+        """
+        self.max_jobs = max_jobs
+        self.save_records = save_records
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self.loop = asyncio.new_event_loop()
+        self._slots = asyncio.Semaphore(max_running)
+        self._thread = threading.Thread(target=self.loop.run_forever, name="persona-jobs", daemon=True)
+        self._thread.start()
+
+    def submit(self, spec):
+        """Queues a job for a validated spec (see parse_job_spec) and returns its initial status."""
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'id': job_id,
+            'persona_name': spec['name'],
+            'status': 'queued',
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'stage_timings': {},
+            'results': None,
+            'usage': None,
+            'error': None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._evict()
+            snapshot = dict(job)
+        asyncio.run_coroutine_threadsafe(self._run(job_id, spec), self.loop)
+        return snapshot
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in ('done', 'error')]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    async def _run(self, job_id, spec):
+        async with self._slots:
+            self._update(job_id, status='running', started_at=time.time())
+            stage_timings = {}
+
+            def on_stage_complete(name, result, elapsed):
+                stage_timings[name] = elapsed
+                self._update(job_id, stage_timings=dict(stage_timings))
+
+            try:
+                start = time.perf_counter()
+                results, stage_timings = await persona_async.run_persona_pipeline(
+                    spec['name'], spec['context'], max_rounds=spec['max_rounds'], pipeline_lag=spec['pipeline_lag'],
+                    reuse_analyses=spec['reuse_analyses'], on_stage_complete=on_stage_complete, run_id=job_id
+                )
+                stage_timings['total'] = time.perf_counter() - start
+                if self.save_records:
+                    record = dict(results, persona_name=spec['name'], stage_timings=stage_timings)
+                    await asyncio.to_thread(get_default_store().add, record)
+            except Exception as e:
+                self._update(job_id, status='error', error=f"{type(e).__name__}: {e}", finished_at=time.time())
+                return
+            self._update(job_id, status='done', results=results, stage_timings=stage_timings,
+                         usage=default_profiler.run_summary(job_id), finished_at=time.time())
+
+    def get(self, job_id):
+        """Returns a copy of the job's status, or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list_jobs(self, limit=100):
+        """Returns summaries (no results) of the newest jobs."""
+        with self._lock:
+            jobs = list(self._jobs.values())[-limit:]
+        return [{key: job[key] for key in ('id', 'persona_name', 'status', 'created_at', 'finished_at')}
+                for job in reversed(jobs)]
+
+def parse_job_spec(payload):
+    """Validates a POST /jobs body and returns the job spec; raises ValueError on bad input."""
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    name = payload.get('name')
+    context = payload.get('context', '')
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("'name' must be a non-empty string")
+    if not isinstance(context, str):
+        raise ValueError("'context' must be a string")
+    spec = {'name': name.strip(), 'context': context, 'reuse_analyses': bool(payload.get('reuse_analyses', True))}
+    for field, default, upper in (('max_rounds', 4, 10), ('pipeline_lag', 0, 10)):
+        value = payload.get(field, default)
+        if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= upper:
+            raise ValueError(f"'{field}' must be an integer between 0 and {upper}")
+        spec[field] = value
+    return spec
+
+# ---------------------------------------------------------------------
+# HTTP Interface
+# ---------------------------------------------------------------------
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """JSON endpoints over the server's JobManager (self.server.manager)."""
+
+    def _send(self, status, body, content_type="application/json"):
+        data = (json.dumps(body) if content_type == "application/json" else body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        manager = self.server.manager
+        path = self.path.split('?', 1)[0].rstrip('/')
+        if path == '/healthz':
+            self._send(200, {'status': 'ok'})
+        elif path == '/metrics':
+            self._send(200, default_profiler.prometheus_text(), content_type="text/plain; version=0.0.4")
+        elif path == '/jobs':
+            self._send(200, {'jobs': manager.list_jobs()})
+        elif path.startswith('/jobs/'):
+            job = manager.get(path[len('/jobs/'):])
+            if job is None:
+                self._send(404, {'error': 'Job not found'})
+            else:
+                self._send(200, job)
+        else:
+            self._send(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path.split('?', 1)[0].rstrip('/') != '/jobs':
+            self._send(404, {'error': 'Not found'})
+            return
+        try:
+            length = self.headers.get('Content-Length') or '0'
+            if not length.isdigit():
+                raise ValueError(f"Invalid Content-Length: {length!r}")
+            length = int(length)
+            if length > MAX_BODY_BYTES:
+                self._send(413, {'error': 'Request body too large'})
+                return
+            spec = parse_job_spec(json.loads(self.rfile.read(length) or b'null'))
+        except (ValueError, UnicodeDecodeError) as e:
+            self._send(400, {'error': str(e)})
+            return
+        job = self.server.manager.submit(spec)
+        self._send(202, job)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve persona simulations as background jobs over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--max-running", type=int, default=200, help="Simulations allowed to run concurrently")
+    parser.add_argument("--max-jobs", type=int, default=1000, help="Jobs kept in memory for status polling")
+    parser.add_argument("--max-concurrent-requests", type=int, default=0,
+                        help="Global cap on in-flight Gemini requests (0 = only RPM/TPM budgets)")
+    parser.add_argument("--no-records", action="store_true", help="Do not save finished runs to the record store")
+    args = parser.parse_args()
+
+    persona_core.set_max_concurrent_requests(args.max_concurrent_requests)
+    # Open the persona index and fit a warm-up TF-IDF model before the first job, so no job pays that setup on the
+    # shared event loop (the index is needed whatever the compaction setting)
+    persona_index.get_default_index()
+    prompt_compaction.warm_up()
+    server = ThreadingHTTPServer((args.host, args.port), JobRequestHandler)
+    server.manager = JobManager(max_running=args.max_running, max_jobs=args.max_jobs,
+                                save_records=not args.no_records)
+    print(f"Serving persona simulations on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
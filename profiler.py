@@ -0,0 +1,227 @@
+import contextvars
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# ---------------------------------------------------------------------
+# Per-Stage Latency, Token and Cost Profiling
+# ---------------------------------------------------------------------
+# USD per 1M tokens (input, output)
+MODEL_PRICING = {
+    'gemini-2.0-flash': (0.10, 0.40),
+}
+
+_current_run = contextvars.ContextVar('profile_run', default=None)
+
+@contextmanager
+def profile_run(run_id):
+    """Attributes every model call made in the enclosed block to run_id."""
+    token = _current_run.set(run_id)
+    try:
+        yield
+    finally:
+        _current_run.reset(token)
+
+def percentile(samples, percent):
+    """Nearest-rank percentile of samples, or 0.0 when empty."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(percent / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+def estimate_cost(model_name, prompt_tokens, output_tokens):
+    """Estimated USD cost of a call from MODEL_PRICING (0.0 for unknown models)."""
+    input_price, output_price = MODEL_PRICING.get(model_name.split('/')[-1], (0.0, 0.0))
+    return (prompt_tokens * input_price + output_tokens * output_price) / 1e6
+
+def _empty_totals():
+    return {'calls': 0, 'seconds': 0.0, 'prompt_tokens': 0, 'output_tokens': 0, 'cost': 0.0, 'cache_hits': 0,
+            'tokens_saved': 0}
+
+class StageProfiler:
+    """
+    Records wall time, prompt/output tokens and estimated cost for every model
+    call, labelled by pipeline stage and run, and exports them as a stage
+    summary, Prometheus text or a Chrome/Perfetto JSON trace.
+    """
+
+    def __init__(self, max_calls=5000, max_runs=50):
+        """
+        :param max_calls: Most recent calls kept for percentiles and traces
+        :param max_runs: Most recent runs kept for per-run totals
+        """
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=max_calls)
+        self._runs = OrderedDict()
+        self._totals = {}
+
+    def record(self, stage, model_name, started_at, elapsed, prompt_tokens, output_tokens,
+               cache_hit=False, estimated=False):
+        """
+        Records one model call.
+
+        :param stage: Pipeline stage label (e.g. 'persona_turn', 'final_pitch')
+        :param model_name: Model the call was sent to
+        :param started_at: Wall-clock start time (time.time())
+        :param elapsed: Wall time in seconds
+        :param prompt_tokens: Prompt token count
+        :param output_tokens: Output token count
+        :param cache_hit: Whether the response came from the response cache (no tokens billed)
+        :param estimated: Whether token counts are estimates rather than reported usage
+        """
+        cost = 0.0 if cache_hit else estimate_cost(model_name, prompt_tokens, output_tokens)
+        call = {
+            'stage': stage,
+            'run_id': _current_run.get(),
+            'thread': threading.get_ident(),
+            'started_at': started_at,
+            'elapsed': elapsed,
+            'prompt_tokens': prompt_tokens,
+            'output_tokens': output_tokens,
+            'cost': cost,
+            'cache_hit': cache_hit,
+            'estimated': estimated,
+        }
+        with self._lock:
+            self._calls.append(call)
+            stage_totals = self._totals.setdefault(stage, _empty_totals())
+            for totals in (stage_totals, self._run_totals(call['run_id'])):
+                if totals is None:
+                    continue
+                totals['calls'] += 1
+                totals['seconds'] += elapsed
+                totals['prompt_tokens'] += prompt_tokens
+                totals['output_tokens'] += output_tokens
+                totals['cost'] += cost
+                totals['cache_hits'] += int(cache_hit)
+
+    def record_compaction(self, stage, tokens_before, tokens_after):
+        """
+        Records the prompt tokens a stage saved by compacting one of its inputs.
+
+        :param stage: Pipeline stage label the compacted input is sent with
+        :param tokens_before: Estimated tokens of the input before compaction
+        :param tokens_after: Estimated tokens after compaction
+        """
+        saved = max(0, tokens_before - tokens_after)
+        with self._lock:
+            for totals in (self._totals.setdefault(stage, _empty_totals()), self._run_totals(_current_run.get())):
+                if totals is not None:
+                    totals['tokens_saved'] += saved
+
+    def _run_totals(self, run_id):
+        if run_id is None:
+            return None
+        if run_id not in self._runs:
+            self._runs[run_id] = _empty_totals()
+            while len(self._runs) > self.max_runs:
+                self._runs.popitem(last=False)
+        return self._runs[run_id]
+
+    def run_summary(self, run_id):
+        """Returns call count, model seconds, tokens and cost totals for one run, or None."""
+        with self._lock:
+            totals = self._runs.get(run_id)
+            return dict(totals) if totals else None
+
+    def calls(self, run_id=None):
+        """Returns recent call records (optionally only one run's) in the order they finished."""
+        with self._lock:
+            return [dict(call) for call in self._calls if run_id is None or call['run_id'] == run_id]
+
+    def stage_summary(self):
+        """
+        Returns per-stage rows with call counts, p50/p95 latency, mean tokens and
+        total cost over recent calls, plus the cumulative tokens saved by compaction.
+        """
+        with self._lock:
+            calls = list(self._calls)
+            tokens_saved = {stage: totals['tokens_saved'] for stage, totals in self._totals.items()}
+        by_stage = OrderedDict()
+        for call in calls:
+            by_stage.setdefault(call['stage'], []).append(call)
+        rows = []
+        for stage, stage_calls in by_stage.items():
+            latencies = [call['elapsed'] for call in stage_calls]
+            rows.append({
+                'stage': stage,
+                'calls': len(stage_calls),
+                'p50_seconds': percentile(latencies, 50),
+                'p95_seconds': percentile(latencies, 95),
+                'mean_prompt_tokens': sum(call['prompt_tokens'] for call in stage_calls) / len(stage_calls),
+                'mean_output_tokens': sum(call['output_tokens'] for call in stage_calls) / len(stage_calls),
+                'cost': sum(call['cost'] for call in stage_calls),
+                'cache_hit_rate': sum(call['cache_hit'] for call in stage_calls) / len(stage_calls),
+                'tokens_saved': tokens_saved.get(stage, 0),
+            })
+        return rows
+
+    def prometheus_text(self):
+        """Returns cumulative counters and recent latency quantiles in Prometheus text exposition format."""
+        with self._lock:
+            totals = {stage: dict(values) for stage, values in self._totals.items()}
+        summary = {row['stage']: row for row in self.stage_summary()}
+        # (family, type, sample suffix and value formatter per stage)
+        families = [
+            ('persona_llm_calls_total', 'counter', lambda v: [('', v['calls'])]),
+            ('persona_llm_cache_hits_total', 'counter', lambda v: [('', v['cache_hits'])]),
+            ('persona_llm_seconds_total', 'counter', lambda v: [('', f"{v['seconds']:.6f}")]),
+            ('persona_llm_tokens_total', 'counter',
+             lambda v: [(',kind="prompt"', v['prompt_tokens']), (',kind="output"', v['output_tokens'])]),
+            ('persona_llm_cost_usd_total', 'counter', lambda v: [('', f"{v['cost']:.8f}")]),
+            ('persona_llm_tokens_saved_total', 'counter', lambda v: [('', v['tokens_saved'])]),
+        ]
+        lines = []
+        for family, metric_type, samples in families:
+            lines.append(f"# TYPE {family} {metric_type}")
+            for stage, values in totals.items():
+                lines.extend(f'{family}{{stage="{stage}"{extra}}} {value}' for extra, value in samples(values))
+
+        # Quantiles cover the recent-call window; _sum and _count are cumulative
+        lines.append("# TYPE persona_llm_latency_seconds summary")
+        for stage, values in totals.items():
+            label = f'stage="{stage}"'
+            if stage in summary:
+                lines.append(f"persona_llm_latency_seconds{{{label},quantile=\"0.5\"}} {summary[stage]['p50_seconds']:.6f}")
+                lines.append(f"persona_llm_latency_seconds{{{label},quantile=\"0.95\"}} {summary[stage]['p95_seconds']:.6f}")
+            lines.append(f"persona_llm_latency_seconds_sum{{{label}}} {values['seconds']:.6f}")
+            lines.append(f"persona_llm_latency_seconds_count{{{label}}} {values['calls']}")
+        return "\n".join(lines) + "\n"
+
+    def trace_json(self, run_id=None):
+        """
+        Returns recent calls (optionally only one run's) as a Chrome trace-event
+        JSON document, viewable in chrome://tracing or Perfetto.
+        """
+        calls = self.calls(run_id)
+        events = [{
+            'name': call['stage'],
+            'cat': 'llm',
+            'ph': 'X',
+            'ts': int(call['started_at'] * 1e6),
+            'dur': int(call['elapsed'] * 1e6),
+            'pid': str(call['run_id']),
+            'tid': call['thread'],
+            'args': {key: call[key] for key in ('prompt_tokens', 'output_tokens', 'cost', 'cache_hit', 'estimated')},
+        } for call in calls]
+        return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'})
+
+default_profiler = StageProfiler()
+
+@contextmanager
+def profile_call(stage, model_name, profiler=None):
+    """
+    Times a model call and records it on exit. The body fills in the yielded dict:
+    'prompt_tokens', 'output_tokens', and optionally 'cache_hit' and 'estimated'.
+    """
+    profiler = profiler or default_profiler
+    usage = {'prompt_tokens': 0, 'output_tokens': 0, 'cache_hit': False, 'estimated': False}
+    started_at, start = time.time(), time.perf_counter()
+    yield usage
+    profiler.record(stage, model_name, started_at, time.perf_counter() - start,
+                    usage['prompt_tokens'], usage['output_tokens'],
+                    cache_hit=usage['cache_hit'], estimated=usage['estimated'])
@@ -0,0 +1,140 @@
+import json
+import os
+import re
+
+from rate_limiter import estimate_tokens
+from profiler import default_profiler
+
+# ---------------------------------------------------------------------
+# Per-Stage Token Budgets
+# ---------------------------------------------------------------------
+# Prompt-token budget for each long input of a downstream stage. Inputs over
+# budget are compacted; PERSONA_COMPACTION_BUDGETS (JSON, same shape) overrides
+# individual entries and PERSONA_COMPACTION=0 turns compaction off.
+COMPACTION_BUDGETS = {
+    'persona_turn': {'analysis_text': 350},
+    'final_pitch': {'refined_analysis': 400, 'conversation_log': 1000},
+    'cold_email': {'analysis_text': 300, 'refined_analysis': 300, 'final_pitch': 500},
+}
+for _stage, _budgets in json.loads(os.getenv("PERSONA_COMPACTION_BUDGETS", "{}")).items():
+    COMPACTION_BUDGETS.setdefault(_stage, {}).update(_budgets)
+
+COMPACTION_ENABLED = os.getenv("PERSONA_COMPACTION", "1") != "0"
+
+# Bonus for the first sentence of a line, which usually states its topic
+LEAD_SENTENCE_BONUS = 0.1
+
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+SPEAKER_PREFIX = re.compile(r"^([A-Z][\w .'-]{0,40}:\s+)")
+
+# ---------------------------------------------------------------------
+# Extractive TF-IDF Compaction
+# ---------------------------------------------------------------------
+def _is_header(line):
+    stripped = line.strip()
+    return stripped.startswith('#') or (stripped.endswith(':') and len(stripped) <= 60)
+
+def _split_units(text):
+    """
+    Splits text into lines and scoreable sentences. Returns (lines, units)
+    where each line is (prefix, keep_always) and each unit is
+    (line index, position in line, sentence). Headers and blank lines are
+    kept as is; a leading "Speaker: " prefix stays with its line.
+    """
+    lines, units = [], []
+    for line in text.splitlines():
+        if not line.strip() or _is_header(line):
+            lines.append((line, True))
+            continue
+        prefix_match = SPEAKER_PREFIX.match(line)
+        prefix = prefix_match.group(1) if prefix_match else ""
+        for position, sentence in enumerate(SENTENCE_BREAK.split(line[len(prefix):].strip())):
+            units.append((len(lines), position, sentence))
+        lines.append((prefix, False))
+    return lines, units
+
+def _score_units(sentences, query=None):
+    """
+    Scores sentences by TF-IDF cosine similarity to the centroid of all of them
+    (and, when given, to the query), or returns None when there is no
+    vocabulary to score with.
+    """
+    # numpy/scikit-learn load on the first over-budget input rather than at import
+    import numpy as np
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizer = TfidfVectorizer(stop_words='english', sublinear_tf=True)
+    try:
+        matrix = vectorizer.fit_transform(sentences)
+    except ValueError:
+        return None
+    scores = matrix @ np.asarray(matrix.mean(axis=0)).T
+    if query:
+        scores = 0.5 * scores + 0.5 * (matrix @ vectorizer.transform([query]).T).toarray()
+    return scores.ravel().tolist()
+
+def compact_text(text, max_tokens, query=None):
+    """
+    Shrinks text to about max_tokens by keeping its highest-scoring sentences
+    in their original order, along with headers and speaker prefixes. Text
+    already within budget is returned unchanged.
+
+    :param text: Text to compact
+    :param max_tokens: Token budget (estimated at ~4 characters per token)
+    :param query: Optional text whose topics the kept sentences should favour
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines, units = _split_units(text)
+    if not units:
+        return text
+    scores = _score_units([sentence for _, _, sentence in units], query)
+    if scores is None:
+        scores = [-index for index in range(len(units))]
+    ranked = sorted(range(len(units)), reverse=True,
+                    key=lambda index: scores[index] + (LEAD_SENTENCE_BONUS if units[index][1] == 0 else 0.0))
+
+    remaining = max_tokens - sum(estimate_tokens(line) for line, keep in lines if keep and line.strip())
+    selected, seen, used_lines = set(), set(), set()
+    for index in ranked:
+        line_index, _, sentence = units[index]
+        # Repeated sentences (e.g. the same talking point in several turns) are kept once
+        if sentence.lower() in seen:
+            continue
+        cost = estimate_tokens(sentence) + (0 if line_index in used_lines else estimate_tokens(lines[line_index][0]))
+        if cost <= remaining:
+            selected.add(index)
+            seen.add(sentence.lower())
+            used_lines.add(line_index)
+            remaining -= cost
+
+    kept = {}
+    for index in sorted(selected):
+        kept.setdefault(units[index][0], []).append(units[index][2])
+    output = []
+    for line_index, (line, keep) in enumerate(lines):
+        if keep:
+            output.append(line)
+        elif line_index in kept:
+            output.append(line + " ".join(kept[line_index]))
+    return re.sub(r'\n{3,}', '\n\n', "\n".join(output)).strip()
+
+def warm_up():
+    """
+    Loads scikit-learn and fits one small TF-IDF model, so the first real
+    compaction does not pay the import (call before serving or measuring).
+    """
+    if COMPACTION_ENABLED:
+        compact_text("Flexible talent fits the team. Hiring takes time. Compliance matters across markets.", 1)
+
+def compact_input(stage, field, text, query=None):
+    """
+    Compacts one input of a stage's prompt to its budget in COMPACTION_BUDGETS
+    and records the tokens saved on the default profiler. Inputs without a
+    budget, or with compaction turned off, are returned unchanged.
+    """
+    budget = COMPACTION_BUDGETS.get(stage, {}).get(field)
+    if not COMPACTION_ENABLED or budget is None or not text:
+        return text
+    compacted = compact_text(text, budget, query=query)
+    default_profiler.record_compaction(stage, estimate_tokens(text), estimate_tokens(compacted))
+    return compacted
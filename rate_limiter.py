@@ -0,0 +1,315 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from profiler import percentile
+
+# ---------------------------------------------------------------------
+# Priority Lanes
+# ---------------------------------------------------------------------
+INTERACTIVE = 0
+BATCH = 1
+LANE_NAMES = {INTERACTIVE: 'interactive', BATCH: 'batch'}
+
+_current_priority = contextvars.ContextVar('request_priority', default=INTERACTIVE)
+
+@contextmanager
+def request_priority(priority):
+    """
+    Runs the enclosed block's Gemini requests in the given lane (INTERACTIVE or BATCH).
+    Interactive requests are always dispatched ahead of queued batch requests.
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+# ---------------------------------------------------------------------
+# Retry Classification
+# ---------------------------------------------------------------------
+RETRYABLE_ERROR_NAMES = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable',
+    'InternalServerError', 'DeadlineExceeded', 'GatewayTimeout',
+}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def is_retryable(error):
+    """Returns True for quota and transient server errors worth retrying."""
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    code = getattr(error, 'code', None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) used for TPM budgeting."""
+    return max(1, len(text) // 4)
+
+# ---------------------------------------------------------------------
+# Token Bucket
+# ---------------------------------------------------------------------
+class TokenBucket:
+    """
+    Token bucket refilled continuously at per_minute / 60 tokens per second.
+    Not thread-safe on its own; RequestScheduler guards it with its lock.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount tokens are available (0 if available now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        """Takes amount tokens; a negative amount refunds over-estimated usage."""
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+# ---------------------------------------------------------------------
+# Request Scheduler
+# ---------------------------------------------------------------------
+class RequestScheduler:
+    """
+    Shared gate for Gemini requests: enforces requests-per-minute and
+    tokens-per-minute budgets and an optional concurrency cap, dispatches
+    waiting requests by priority lane, and retries quota/transient errors
+    with exponential backoff and full jitter.
+    """
+
+    def __init__(self, requests_per_minute=2000, tokens_per_minute=4000000, max_concurrent=None,
+                 max_retries=5, base_backoff=1.0, max_backoff=60.0, latency_window=500):
+        """
+        :param requests_per_minute: RPM budget
+        :param tokens_per_minute: TPM budget (prompt + output tokens)
+        :param max_concurrent: Maximum requests in flight at once, or None for unlimited
+        :param max_retries: Retries per request for retryable errors
+        :param base_backoff: Backoff before the first retry, in seconds
+        :param max_backoff: Upper bound on a single backoff, in seconds
+        :param latency_window: Number of recent requests kept for latency percentiles
+        """
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._tickets = itertools.count()
+        self._in_flight = 0
+
+        self._requests = 0
+        self._retries = 0
+        self._errors = 0
+        self._latencies = deque(maxlen=latency_window)
+        self._queue_waits = deque(maxlen=latency_window)
+
+    @classmethod
+    def from_env(cls):
+        """Builds a scheduler from GEMINI_RPM, GEMINI_TPM, GEMINI_MAX_CONCURRENT and GEMINI_MAX_RETRIES."""
+        max_concurrent = os.getenv("GEMINI_MAX_CONCURRENT")
+        return cls(
+            requests_per_minute=float(os.getenv("GEMINI_RPM", "2000")),
+            tokens_per_minute=float(os.getenv("GEMINI_TPM", "4000000")),
+            max_concurrent=int(max_concurrent) if max_concurrent else None,
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "5")),
+        )
+
+    def set_max_concurrent(self, limit):
+        """Changes the concurrency cap (None or 0 for unlimited)."""
+        with self._cond:
+            self.max_concurrent = limit or None
+            self._cond.notify_all()
+
+    def _acquire(self, tokens, priority):
+        with self._cond:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiters, ticket)
+            self._cond.notify_all()
+            try:
+                while True:
+                    if self._waiters[0] != ticket or (self.max_concurrent and self._in_flight >= self.max_concurrent):
+                        self._cond.wait()
+                        continue
+                    now = time.monotonic()
+                    delay = max(self.request_bucket.wait_time(1, now), self.token_bucket.wait_time(tokens, now))
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+                    heapq.heappop(self._waiters)
+                    self.request_bucket.consume(1)
+                    self.token_bucket.consume(tokens)
+                    self._in_flight += 1
+                    self._cond.notify_all()
+                    return
+            except BaseException:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+
+    async def _acquire_async(self, tokens, priority, poll_interval=0.02):
+        # Event-loop variant of _acquire: never blocks the loop on the condition,
+        # it rechecks after the bucket delay or poll_interval instead
+        with self._cond:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiters, ticket)
+            self._cond.notify_all()
+        try:
+            while True:
+                with self._cond:
+                    delay = poll_interval
+                    if self._waiters[0] == ticket and not (self.max_concurrent and self._in_flight >= self.max_concurrent):
+                        now = time.monotonic()
+                        delay = max(self.request_bucket.wait_time(1, now), self.token_bucket.wait_time(tokens, now))
+                        if delay <= 0:
+                            heapq.heappop(self._waiters)
+                            self.request_bucket.consume(1)
+                            self.token_bucket.consume(tokens)
+                            self._in_flight += 1
+                            self._cond.notify_all()
+                            return
+                await asyncio.sleep(delay)
+        except BaseException:
+            with self._cond:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+            raise
+
+    def _release(self, token_adjustment=0):
+        with self._cond:
+            self._in_flight -= 1
+            if token_adjustment:
+                self.token_bucket.consume(token_adjustment)
+            self._cond.notify_all()
+
+    def call(self, func, tokens=1, priority=None):
+        """
+        Runs func() once budget is available, retrying retryable errors.
+
+        :param func: Zero-argument callable performing the request
+        :param tokens: Estimated tokens the request will use
+        :param priority: Lane to queue in; defaults to the current request_priority()
+        :return: Whatever func returns
+        """
+        priority = _current_priority.get() if priority is None else priority
+        attempt = 0
+        while True:
+            queued_at = time.monotonic()
+            self._acquire(tokens, priority)
+            started_at = time.monotonic()
+            result = None
+            try:
+                result = func()
+            except Exception as e:
+                if not self._failed(e, attempt):
+                    raise
+            else:
+                self._succeeded(queued_at, started_at)
+                return result
+            finally:
+                # Also runs on KeyboardInterrupt and SystemExit, so the slot never leaks
+                self._release(self._token_adjustment(result, tokens))
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def call_async(self, func, tokens=1, priority=None):
+        """
+        Awaits func() once budget is available, retrying retryable errors. Shares
+        budgets, lanes and metrics with call().
+
+        :param func: Zero-argument coroutine function performing the request
+        :param tokens: Estimated tokens the request will use
+        :param priority: Lane to queue in; defaults to the current request_priority()
+        :return: Whatever func's coroutine returns
+        """
+        priority = _current_priority.get() if priority is None else priority
+        attempt = 0
+        while True:
+            queued_at = time.monotonic()
+            await self._acquire_async(tokens, priority)
+            started_at = time.monotonic()
+            result = None
+            try:
+                result = await func()
+            except Exception as e:
+                if not self._failed(e, attempt):
+                    raise
+            else:
+                self._succeeded(queued_at, started_at)
+                return result
+            finally:
+                # Also runs when the request is cancelled, so the slot never leaks
+                self._release(self._token_adjustment(result, tokens))
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _backoff(self, attempt):
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def _failed(self, error, attempt):
+        """Counts a failed request and returns whether it should be retried."""
+        retry = attempt < self.max_retries and is_retryable(error)
+        with self._cond:
+            if retry:
+                self._retries += 1
+            else:
+                self._errors += 1
+        return retry
+
+    @staticmethod
+    def _token_adjustment(result, tokens):
+        """Reconciles the estimate with actual usage when the response reports it."""
+        usage = getattr(result, 'usage_metadata', None)
+        actual_tokens = getattr(usage, 'total_token_count', None)
+        return actual_tokens - tokens if isinstance(actual_tokens, int) else 0
+
+    def _succeeded(self, queued_at, started_at):
+        finished_at = time.monotonic()
+        with self._cond:
+            self._requests += 1
+            self._queue_waits.append(started_at - queued_at)
+            self._latencies.append(finished_at - started_at)
+
+    def metrics(self):
+        """Returns queue depth, in-flight count, counters and latency percentiles (seconds)."""
+        with self._cond:
+            depth_by_lane = {name: 0 for name in LANE_NAMES.values()}
+            for priority, _ in self._waiters:
+                lane = LANE_NAMES.get(priority, str(priority))
+                depth_by_lane[lane] = depth_by_lane.get(lane, 0) + 1
+            return {
+                'queue_depth': len(self._waiters),
+                'queue_depth_by_lane': depth_by_lane,
+                'in_flight': self._in_flight,
+                'requests': self._requests,
+                'retries': self._retries,
+                'errors': self._errors,
+                'latency_p50': percentile(self._latencies, 50),
+                'latency_p95': percentile(self._latencies, 95),
+                'queue_wait_p50': percentile(self._queue_waits, 50),
+                'queue_wait_p95': percentile(self._queue_waits, 95),
+            }
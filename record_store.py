@@ -0,0 +1,124 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# ---------------------------------------------------------------------
+# Persistent Conversation Record Store
+# ---------------------------------------------------------------------
+DEFAULT_RECORDS_PATH = os.getenv("PERSONA_RECORDS_PATH", ".persona_records.sqlite3")
+RECORD_FIELDS = (
+    'conversation_log', 'conversation_review', 'analysis_text',
+    'refined_analysis', 'final_pitch', 'cold_email', 'stage_timings',
+)
+
+def _fts_query(text):
+    """Turns free text into an FTS5 query matching every word, ignoring FTS syntax characters."""
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+class RecordStore:
+    """
+    Disk-backed store of simulation runs. Each record's text fields are kept as
+    one zlib-compressed payload, and conversation logs and reviews are indexed
+    in a contentless FTS5 table. Listing and search return lightweight
+    summaries, and full records are decompressed only when requested, so memory
+    use does not grow with the number of stored runs.
+    """
+
+    def __init__(self, db_path=DEFAULT_RECORDS_PATH):
+        """
+        :param db_path: SQLite file holding the records, or None for memory only
+        """
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "id INTEGER PRIMARY KEY, persona_name TEXT NOT NULL, created_at REAL NOT NULL, payload BLOB NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS records_persona ON records (persona_name COLLATE NOCASE, id)")
+        self._db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5("
+            "conversation_log, conversation_review, content='')"
+        )
+        self._db.commit()
+
+    def add(self, record):
+        """
+        Stores a simulation record and indexes it for search.
+
+        :param record: Dict with 'persona_name' and any of RECORD_FIELDS
+        :return: Id of the stored record
+        """
+        payload = {field: record.get(field) for field in RECORD_FIELDS}
+        blob = zlib.compress(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO records (persona_name, created_at, payload) VALUES (?, ?, ?)",
+                (record['persona_name'].strip(), time.time(), blob)
+            )
+            self._db.execute(
+                "INSERT INTO records_fts (rowid, conversation_log, conversation_review) VALUES (?, ?, ?)",
+                (cursor.lastrowid, payload['conversation_log'] or '', payload['conversation_review'] or '')
+            )
+            self._db.commit()
+            return cursor.lastrowid
+
+    def get(self, record_id):
+        """Returns the full record with the given id, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, persona_name, created_at, payload FROM records WHERE id = ?", (record_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        record = json.loads(zlib.decompress(row[3]).decode('utf-8'))
+        record.update({'id': row[0], 'persona_name': row[1], 'created_at': row[2]})
+        return record
+
+    def _where(self, query, persona_name):
+        clauses, params = [], []
+        if query and query.strip():
+            clauses.append("id IN (SELECT rowid FROM records_fts WHERE records_fts MATCH ?)")
+            params.append(_fts_query(query))
+        if persona_name and persona_name.strip():
+            clauses.append("persona_name = ? COLLATE NOCASE")
+            params.append(persona_name.strip())
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, query=None, persona_name=None):
+        """Returns how many records match the optional full-text query and persona name."""
+        where, params = self._where(query, persona_name)
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM records{where}", params).fetchone()[0]
+
+    def list_records(self, page=1, page_size=20, query=None, persona_name=None):
+        """
+        Returns one page of record summaries (id, persona_name, created_at), newest first.
+
+        :param page: 1-based page number
+        :param page_size: Records per page
+        :param query: Optional full-text query over conversation logs and reviews
+        :param persona_name: Optional persona name to filter by (case-insensitive)
+        """
+        where, params = self._where(query, persona_name)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, persona_name, created_at FROM records{where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + [page_size, (page - 1) * page_size]
+            ).fetchall()
+        return [{'id': row[0], 'persona_name': row[1], 'created_at': row[2]} for row in rows]
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_default_store():
+    """Returns the process-wide record store, opening it on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = RecordStore()
+        return _default_store
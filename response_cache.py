@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# ---------------------------------------------------------------------
+# Content-Addressed Response Cache
+# ---------------------------------------------------------------------
+DEFAULT_CACHE_PATH = os.getenv("PERSONA_CACHE_PATH", ".persona_cache.sqlite3")
+DEFAULT_MAX_ENTRIES = int(os.getenv("PERSONA_CACHE_MAX_ENTRIES", "512"))
+DEFAULT_TTL_SECONDS = float(os.getenv("PERSONA_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+DEFAULT_MAX_DISK_ENTRIES = int(os.getenv("PERSONA_CACHE_MAX_DISK_ENTRIES", "50000"))
+
+def make_cache_key(model_name, prompt, generation_config=None):
+    """
+    Builds a content hash from everything that determines a model response.
+
+    :param model_name: Name of the generative model (e.g., 'models/gemini-2.0-flash')
+    :param prompt: Full prompt text sent to the model
+    :param generation_config: Optional generation config (dict or SDK object)
+    :return: Hex SHA-256 digest identifying the request
+    """
+    if generation_config is not None and not isinstance(generation_config, dict):
+        generation_config = vars(generation_config) if hasattr(generation_config, '__dict__') else str(generation_config)
+    payload = json.dumps(
+        {'model': model_name, 'prompt': prompt, 'config': generation_config},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    Two-level response cache: an in-process LRU in front of a SQLite store
+    that is shared across Streamlit sessions and survives restarts. The store
+    is pruned on open and every prune_every inserts: expired rows are deleted,
+    then the oldest rows beyond max_disk_entries.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_disk_entries=DEFAULT_MAX_DISK_ENTRIES, prune_every=256):
+        """
+        :param db_path: SQLite file for the persistent store, or None for memory only
+        :param max_entries: Maximum number of responses kept in the in-process LRU
+        :param ttl_seconds: Age after which an entry is treated as expired
+        :param max_disk_entries: Maximum number of responses kept in the SQLite store
+        :param prune_every: Inserts between prunes of the SQLite store
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.prune_every = prune_every
+        self._inserts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+            self._prune()
+
+    def _prune(self):
+        """Deletes expired rows, then the oldest rows beyond max_disk_entries (caller holds the lock)."""
+        self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        excess = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY created_at LIMIT ?)", (excess,)
+            )
+        self._db.commit()
+
+    def _expired(self, created_at):
+        return time.time() - created_at > self.ttl_seconds
+
+    def _remember(self, key, response, created_at):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Returns the cached response text for key, or None on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key, response):
+        """Stores response text under key in memory and on disk."""
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, response, created_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response, created_at)
+                )
+                self._db.commit()
+                self._inserts += 1
+                if self._inserts % self.prune_every == 0:
+                    self._prune()
+
+    def stats(self):
+        """Returns hit/miss counters and current in-memory size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+            }
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache():
+    """Returns the process-wide cache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
+
+def cached_generate(model, prompt, generate, generation_config=None, cache=None):
+    """
+    Returns the cached response for (model, prompt, generation_config), calling
+    generate() and storing its text on a miss.
+
+    :param model: Generative model the prompt is sent to
+    :param prompt: Full prompt text
+    :param generate: Zero-argument callable that performs the real request and returns text
+    :param generation_config: Optional generation config that is part of the cache key
+    :param cache: Cache to use; defaults to the process-wide cache
+    :return: Response text
+    """
+    cache = cache or get_default_cache()
+    key = _model_cache_key(model, prompt, generation_config)
+
+    response = cache.get(key)
+    if response is None:
+        response = generate()
+        cache.set(key, response)
+    return response
+
+async def cached_generate_async(model, prompt, generate, generation_config=None, cache=None):
+    """
+    Async variant of cached_generate: generate is a zero-argument coroutine
+    function, and cache reads and writes run in a worker thread so SQLite I/O
+    never blocks the event loop.
+    """
+    cache = cache or get_default_cache()
+    key = _model_cache_key(model, prompt, generation_config)
+
+    response = await asyncio.to_thread(cache.get, key)
+    if response is None:
+        response = await generate()
+        await asyncio.to_thread(cache.set, key, response)
+    return response
+
+def _model_cache_key(model, prompt, generation_config):
+    model_name = getattr(model, 'model_name', str(model))
+    # Models created with a system instruction answer the same prompt differently
+    system_instruction = getattr(model, '_system_instruction', None)
+    if system_instruction is not None:
+        model_name = f"{model_name}\n{system_instruction}"
+    return make_cache_key(model_name, prompt, generation_config)
@@ -0,0 +1,243 @@
+"""
+Scenario matrix: runs one persona against many sales strategies and ranks them.
+
+The persona analysis and the strategy-independent opening of the meeting (the
+greetings and the persona's full-time preference) are generated once and
+shared. Each strategy then runs the rest of the meeting in parallel, with its
+own objection handling and Q&A scenarios. Each variant is scored by:
+
+- a scored review of the conversation, 1 to 10
+- a local TF-IDF similarity between what the sales agent said and the
+  strategy's target messaging
+
+Usage:
+    python scenario_matrix.py "Jane Doe" --context-file jane.txt --strategies strategies.json -o matrix.jsonl
+"""
+import argparse
+import json
+import re
+import sys
+import time
+import uuid
+
+import persona_core
+from persona_core import DEFAULT_STRATEGY, SALES_SPEAKER
+from profiler import default_profiler, profile_run
+
+# ---------------------------------------------------------------------
+# Sales Strategies
+# ---------------------------------------------------------------------
+# Each strategy has a name, the objection-handling instruction for the sales
+# agent, the scenario each Q&A answer draws on and the messaging it should land
+SALES_STRATEGIES = [
+    dict(DEFAULT_STRATEGY, target_messaging=(
+        "Start with flexible, pre-vetted talent that can transition into full-time roles once they have proven "
+        "themselves. AI matching finds the right fit quickly, and compliance is handled across markets."
+    )),
+    {
+        'name': 'cost_efficiency',
+        'objection_handling': (
+            "Acknowledge the client's preference for full-time hires, then explain how BeGig's flexible talent "
+            "lowers hiring costs and overhead without compromising quality. "
+            "Also, ask how the client currently plans and spends their hiring budget."
+        ),
+        'scenarios': ('cost_savings', 'ai_matching', 'success_story'),
+        'target_messaging': (
+            "Flexible talent lowers hiring costs, recruiting fees and overhead, so the budget goes further while "
+            "quality stays high. Pay only for the expertise the project needs."
+        ),
+    },
+    {
+        'name': 'speed_to_hire',
+        'objection_handling': (
+            "Acknowledge the client's preference for full-time hires, then explain how BeGig fills roles in days "
+            "rather than months so projects never stall while a full-time search runs. "
+            "Also, ask how long their current hiring process takes."
+        ),
+        'scenarios': ('time_to_hire', 'ai_matching', 'success_story'),
+        'target_messaging': (
+            "Fill roles in days instead of months. AI matching shortlists pre-vetted experts quickly, so timelines "
+            "hold and the team keeps momentum while full-time hiring continues."
+        ),
+    },
+    {
+        'name': 'compliance_first',
+        'objection_handling': (
+            "Acknowledge the client's preference for full-time hires, then explain how BeGig handles contracts, "
+            "payroll and compliance for flexible hires across markets, removing the risk of working with freelancers. "
+            "Also, ask which markets the client hires in."
+        ),
+        'scenarios': ('compliance', 'global_markets', 'success_story'),
+        'target_messaging': (
+            "BeGig handles contracts, payroll and compliance in every market, so flexible hires carry no legal or "
+            "administrative risk and the client can hire talent anywhere with confidence."
+        ),
+    },
+    {
+        'name': 'risk_free_trial',
+        'objection_handling': (
+            "Acknowledge the client's preference for full-time hires, then propose a short trial engagement with a "
+            "flexible expert so they can judge fit before committing to a full-time offer. "
+            "Also, ask what would make a trial a success for them."
+        ),
+        'scenarios': ('trial_engagement', 'success_story', 'ai_matching'),
+        'target_messaging': (
+            "Try before you commit: a short trial engagement shows the expert's quality and culture fit, and a "
+            "successful trial can turn into a full-time role with no long-term risk."
+        ),
+    },
+]
+
+def load_strategies(path):
+    """Reads strategies from a JSON list or a JSONL file; raises ValueError on a malformed strategy."""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    strategies = json.loads(text) if text.lstrip().startswith('[') else [
+        json.loads(line) for line in text.splitlines() if line.strip()
+    ]
+    for strategy in strategies:
+        missing = [key for key in ('name', 'objection_handling', 'scenarios', 'target_messaging') if not strategy.get(key)]
+        if missing:
+            raise ValueError(f"Strategy {strategy.get('name', '?')!r} is missing {', '.join(missing)}")
+        strategy['scenarios'] = tuple(strategy['scenarios'])
+    return strategies
+
+# ---------------------------------------------------------------------
+# Scoring
+# ---------------------------------------------------------------------
+def sales_messaging(conversation_log, persona_name):
+    """Returns everything the sales agent said in a conversation log."""
+    speakers = re.compile(rf'^({re.escape(persona_name)}|{re.escape(SALES_SPEAKER)}): ', re.MULTILINE)
+    parts = speakers.split(conversation_log)
+    # split() alternates [preamble, speaker, text, speaker, text, ...]
+    return "\n".join(text.strip() for speaker, text in zip(parts[1::2], parts[2::2]) if speaker == SALES_SPEAKER)
+
+def messaging_similarity(texts, targets):
+    """Cosine similarity of each text with its target under one TF-IDF model fit on all of them."""
+    # scikit-learn loads on first use rather than at import
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizer = TfidfVectorizer(stop_words='english', sublinear_tf=True)
+    try:
+        matrix = vectorizer.fit_transform(list(texts) + list(targets))
+    except ValueError:
+        return [0.0] * len(texts)
+    # Rows are L2-normalized, so the dot product is the cosine similarity
+    return [float(matrix[i].multiply(matrix[len(texts) + i]).sum()) for i in range(len(texts))]
+
+# ---------------------------------------------------------------------
+# Matrix Runner
+# ---------------------------------------------------------------------
+def run_scenario_matrix(person_name, context_text, strategies=None, max_rounds=4, pipeline_lag=0, workers=None,
+                        review_weight=0.7, on_variant_complete=None, run_id=None):
+    """
+    Runs every strategy against one persona and returns one row per strategy,
+    best first.
+
+    :param person_name: Persona to simulate
+    :param context_text: Context the persona analysis is built from
+    :param strategies: Strategies to compare (defaults to SALES_STRATEGIES)
+    :param max_rounds: Maximum number of dynamic Q&A rounds per meeting
+    :param pipeline_lag: Rounds each meeting may run ahead (0 = serial)
+    :param workers: Variants run concurrently (defaults to one per strategy)
+    :param review_weight: Weight of the review score in the combined score; the rest goes to messaging similarity
+    :param on_variant_complete: Optional callback(strategy name, row, elapsed) invoked as each variant finishes
+    :param run_id: Profiling run id for every model call (defaults to a new id)
+    :return: Rows with rank, strategy, score, review_score, review_summary, messaging_similarity,
+             elapsed and conversation_log
+    """
+    strategies = strategies or SALES_STRATEGIES
+    names = [strategy['name'] for strategy in strategies]
+    if len(set(names)) != len(names):
+        raise ValueError("Strategy names must be unique")
+    run_id = run_id or uuid.uuid4().hex
+
+    with profile_run(run_id):
+        # Computed once and shared by every variant
+        analysis_text = persona_core.get_or_create_analysis(person_name, context_text)
+        persona_agent = persona_core.create_persona_agent(person_name, analysis_text=analysis_text)
+        sales_agent = persona_core.create_sales_conversation_agent()
+        opening = persona_core.simulate_opening(persona_agent, sales_agent, person_name)
+
+        def variant(strategy):
+            def run(**_):
+                start = time.perf_counter()
+                conversation_log = persona_core.simulate_meeting_conversation_with_fulltime_preference(
+                    persona_agent, sales_agent, persona_name=person_name, max_rounds=max_rounds, show_banner=False,
+                    pipeline_lag=pipeline_lag, strategy=strategy, opening=opening
+                )
+                review_score, review_summary = persona_core.score_conversation(conversation_log)
+                return {
+                    'strategy': strategy['name'],
+                    'review_score': review_score,
+                    'review_summary': review_summary,
+                    'conversation_log': conversation_log,
+                    'elapsed': time.perf_counter() - start,
+                }
+            return run
+
+        results, _ = persona_core.run_stage_graph(
+            {strategy['name']: (variant(strategy), []) for strategy in strategies},
+            on_stage_complete=on_variant_complete, max_workers=workers or len(strategies)
+        )
+
+    rows = [results[name] for name in names]
+    similarities = messaging_similarity([sales_messaging(row['conversation_log'], person_name) for row in rows],
+                                        [strategy['target_messaging'] for strategy in strategies])
+    for row, similarity in zip(rows, similarities):
+        row['messaging_similarity'] = similarity
+        # An unparseable review counts as neutral rather than sinking the variant
+        review = row['review_score'] if row['review_score'] is not None else 5.0
+        row['score'] = review_weight * review / 10.0 + (1.0 - review_weight) * similarity
+    rows.sort(key=lambda row: row['score'], reverse=True)
+    for rank, row in enumerate(rows, start=1):
+        row['rank'] = rank
+    return rows
+
+def format_table(rows):
+    """Formats ranked rows as a plain-text table."""
+    lines = [f"{'rank':>4}  {'strategy':<24} {'score':>6} {'review':>7} {'messaging':>10} {'seconds':>8}"]
+    for row in rows:
+        review = f"{row['review_score']:.1f}" if row['review_score'] is not None else "n/a"
+        lines.append(f"{row['rank']:>4}  {row['strategy']:<24} {row['score']:>6.3f} {review:>7} "
+                     f"{row['messaging_similarity']:>10.3f} {row['elapsed']:>8.1f}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sales strategies for one persona and rank them.")
+    parser.add_argument("name", help="Persona name")
+    parser.add_argument("--context", default="", help="Persona context text")
+    parser.add_argument("--context-file", help="Read the persona context from this file instead")
+    parser.add_argument("--strategies", help="JSON list or JSONL file of strategies (default: built-in set)")
+    parser.add_argument("--max-rounds", type=int, default=4, help="Dynamic Q&A rounds per simulated meeting")
+    parser.add_argument("--pipeline-lag", type=int, default=0,
+                        help="Rounds a simulated meeting may run ahead of earlier answers (0 = serial)")
+    parser.add_argument("--workers", type=int, default=0, help="Variants run concurrently (0 = all at once)")
+    parser.add_argument("--max-concurrent-requests", type=int, default=0,
+                        help="Global cap on in-flight Gemini requests (0 = only RPM/TPM budgets)")
+    parser.add_argument("--review-weight", type=float, default=0.7,
+                        help="Weight of the review score against messaging similarity (0-1)")
+    parser.add_argument("-o", "--output", help="Write the ranked rows, with conversation logs, to this JSONL file")
+    args = parser.parse_args()
+
+    context_text = args.context
+    if args.context_file:
+        with open(args.context_file, encoding='utf-8') as f:
+            context_text = f.read()
+    strategies = load_strategies(args.strategies) if args.strategies else SALES_STRATEGIES
+    persona_core.set_max_concurrent_requests(args.max_concurrent_requests)
+
+    run_id = uuid.uuid4().hex
+    rows = run_scenario_matrix(
+        args.name, context_text, strategies=strategies, max_rounds=args.max_rounds, pipeline_lag=args.pipeline_lag,
+        workers=args.workers or None, review_weight=args.review_weight, run_id=run_id,
+        on_variant_complete=lambda name, row, elapsed: print(f"[done] {name} ({elapsed:.1f}s)", file=sys.stderr)
+    )
+    print(format_table(rows))
+    print(f"Usage: {json.dumps(default_profiler.run_summary(run_id))}", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+if __name__ == "__main__":
+    main()
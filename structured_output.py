@@ -0,0 +1,171 @@
+import json
+import re
+
+# ---------------------------------------------------------------------
+# Response Schemas
+# ---------------------------------------------------------------------
+MAX_QUESTIONS = 5
+
+# (JSON field, display title) pairs, in display order
+ANALYSIS_SECTIONS = (
+    ('personality_overview', 'Personality Overview'),
+    ('personality_compatibility', 'Personality Compatibility'),
+    ('communication_style', 'Communication Style'),
+    ('selling_tips', 'Tips for Selling and Engagement'),
+    ('advanced_insights', 'Advanced Insights (DISC, OCEAN, etc.)'),
+)
+REFINED_ANALYSIS_SECTIONS = (
+    ('communication_style', 'Communication Style'),
+    ('personality_traits', 'Personality Traits and Behavioral Cues'),
+    ('key_motivations', 'Key Motivations'),
+    ('pitch_strategy', 'Tailored Pitch Strategy'),
+)
+
+QUESTIONS_SCHEMA = {
+    'type': 'object',
+    'properties': {'questions': {'type': 'array', 'items': {'type': 'string'}}},
+    'required': ['questions'],
+}
+
+REVIEW_SCORE_SCHEMA = {
+    'type': 'object',
+    'properties': {'score': {'type': 'integer'}, 'summary': {'type': 'string'}},
+    'required': ['score', 'summary'],
+}
+
+def sections_schema(sections):
+    """Returns a response schema with one required string field per section."""
+    return {
+        'type': 'object',
+        'properties': {key: {'type': 'string'} for key, _ in sections},
+        'required': [key for key, _ in sections],
+    }
+
+def json_config(schema):
+    """Returns a generation config that constrains the response to JSON matching schema."""
+    return {'response_mime_type': 'application/json', 'response_schema': schema}
+
+QUESTIONS_CONFIG = json_config(QUESTIONS_SCHEMA)
+ANALYSIS_CONFIG = json_config(sections_schema(ANALYSIS_SECTIONS))
+REFINED_ANALYSIS_CONFIG = json_config(sections_schema(REFINED_ANALYSIS_SECTIONS))
+REVIEW_SCORE_CONFIG = json_config(REVIEW_SCORE_SCHEMA)
+
+# ---------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------
+QUESTION_PREFIX = re.compile(r'^\s*(?:[-*•]+|\(?\d+[.):]|Q\d+[.:)]?)\s*')
+PARTIAL_FIELD = re.compile(r'"(\w+)"\s*:\s*"((?:[^"\\]|\\.)*)')
+SECTION_HEADER = re.compile(r'^### (.+)$', re.MULTILINE)
+SCORE_OUT_OF_TEN = re.compile(r'(\d+(?:\.\d+)?)\s*(?:/|out of)\s*10\b')
+
+def _load_json(text):
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return None
+
+def parse_questions(text, max_questions=MAX_QUESTIONS):
+    """
+    Returns the questions from a questions response: the 'questions' list of a
+    JSON response, or the lines of a free-form one. Bullets and numbering are
+    stripped, and headers, blank lines and anything else that is not a
+    question are dropped, so each returned entry is worth a meeting round.
+    """
+    payload = _load_json(text)
+    if isinstance(payload, dict):
+        candidates = payload.get('questions')
+    elif isinstance(payload, list):
+        candidates = payload
+    else:
+        candidates = text.splitlines()
+
+    questions = []
+    for candidate in candidates if isinstance(candidates, list) else []:
+        if not isinstance(candidate, str):
+            continue
+        question = QUESTION_PREFIX.sub('', candidate.strip().strip('*"')).strip('*" ')
+        if question.endswith('?') and question not in questions:
+            questions.append(question)
+    return questions[:max_questions]
+
+def parse_review_score(text):
+    """
+    Returns (score, summary) from a scored review: the JSON fields, or a
+    "N/10" rating found in free-form text. The score is clamped to 0-10 and is
+    None when no rating can be found.
+    """
+    payload = _load_json(text)
+    if isinstance(payload, dict):
+        score, summary = payload.get('score'), payload.get('summary')
+        summary = summary.strip() if isinstance(summary, str) else ''
+    else:
+        match = SCORE_OUT_OF_TEN.search(text)
+        score, summary = (float(match.group(1)) if match else None), text.strip()
+    if isinstance(score, bool) or not isinstance(score, (int, float)):
+        return None, summary
+    return min(10.0, max(0.0, float(score))), summary
+
+def render_sections(values, sections):
+    """Renders section values as '### Title' blocks in section order, skipping empty ones."""
+    return "\n\n".join(f"### {title}\n{values[key].strip()}" for key, title in sections
+                       if isinstance(values.get(key), str) and values[key].strip())
+
+def parse_sections(text, sections):
+    """
+    Returns {field: text} for a sectioned response, read from its JSON or from
+    its rendered '### Title' blocks, or None when the text has neither.
+    """
+    payload = _load_json(text)
+    if isinstance(payload, dict):
+        return {key: payload[key].strip() if isinstance(payload.get(key), str) else '' for key, _ in sections}
+
+    keys_by_title = {title: key for key, title in sections}
+    parts = SECTION_HEADER.split(text)
+    values = {key: '' for key, _ in sections}
+    found = False
+    # split() alternates [preamble, title, body, title, body, ...]
+    for title, body in zip(parts[1::2], parts[2::2]):
+        if title.strip() in keys_by_title:
+            values[keys_by_title[title.strip()]] = body.strip()
+            found = True
+    return values if found else None
+
+def structured_text(text, sections):
+    """Renders a JSON sectioned response for display; text without recognizable sections is returned as is."""
+    values = parse_sections(text, sections)
+    return render_sections(values, sections) if values and any(values.values()) else text
+
+def select_sections(text, sections, keys):
+    """
+    Returns only the given sections of a sectioned text, so downstream prompts
+    carry just the fields they need. Falls back to the whole text when none of
+    them can be found.
+    """
+    values = parse_sections(text, sections)
+    if not values or not any(values.get(key) for key in keys):
+        return text
+    return render_sections(values, [(key, title) for key, title in sections if key in keys])
+
+def render_partial_sections(partial_text, sections):
+    """
+    Renders the string fields of a partially streamed JSON object, including the
+    one still being written. Text that is not a JSON object is returned as is.
+    """
+    if not partial_text.lstrip().startswith('{'):
+        return partial_text
+    values = {}
+    for key, raw in PARTIAL_FIELD.findall(partial_text):
+        # Drop a dangling escape character cut off mid-stream
+        if (len(raw) - len(raw.rstrip('\\'))) % 2:
+            raw = raw[:-1]
+        try:
+            values[key] = json.loads(f'"{raw}"')
+        except ValueError:
+            values[key] = raw
+    return render_sections(values, sections)
+
+def stream_sections(on_text, sections):
+    """Wraps an on_text callback so it receives rendered sections instead of raw streamed JSON."""
+    if on_text is None:
+        return None
+    return lambda partial_text: on_text(render_partial_sections(partial_text, sections))
@@ -0,0 +1,29 @@
+"""
+Regression tests for resuming a batch run from a results file that a crash
+left with a truncated last line.
+
+Run with: python -m pytest -q test_batch_runner.py
+"""
+import json
+
+import batch_runner
+import persona_core
+
+def test_resume_after_partial_last_line(tmp_path, monkeypatch):
+    monkeypatch.setattr(persona_core, 'run_persona_pipeline',
+                        lambda name, context, **kwargs: ({'analysis': f"Analysis of {name}"}, {}))
+    input_path = tmp_path / "personas.jsonl"
+    output_path = tmp_path / "results.jsonl"
+    personas = [{'name': f"Persona {i}", 'context': f"Context {i}"} for i in range(3)]
+    input_path.write_text("".join(json.dumps(persona) + "\n" for persona in personas), encoding='utf-8')
+
+    batch_runner.run_batch(str(input_path), str(output_path), workers=1, max_concurrent_requests=0)
+    lines = output_path.read_text(encoding='utf-8').splitlines(keepends=True)
+    # Simulate a crash while the last record was being written
+    output_path.write_text("".join(lines[:-1]) + lines[-1][:20], encoding='utf-8')
+
+    summary = batch_runner.run_batch(str(input_path), str(output_path), workers=1, max_concurrent_requests=0)
+    assert summary == {'ok': 1, 'error': 0, 'skipped': 2}
+    records = [json.loads(line) for line in output_path.read_text(encoding='utf-8').splitlines()]
+    assert sorted(record['persona_name'] for record in records) == [persona['name'] for persona in personas]
+    assert batch_runner.load_completed_ids(str(output_path)) == {record['id'] for record in records}
@@ -0,0 +1,73 @@
+"""
+Regression tests for the pipelined simulated meeting: with jittered agent
+latency, turns finish out of order, and every turn must still find the turns
+it reads already in place.
+
+Run with: python -m pytest -q test_pipelined_simulation.py
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+
+import pytest
+
+import persona_async
+import persona_core
+
+ROUNDS = 4
+TURN_PATTERN = re.compile(r'^(?:Persona|BeGig Sales): Reply-\d+', re.MULTILINE)
+
+class JitteredAgents:
+    """Stand-in agents that sleep for a random latency per call."""
+
+    def __init__(self, seed, max_latency=0.02):
+        self.max_latency = max_latency
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._replies = 0
+
+    def _delay(self):
+        with self._lock:
+            self._replies += 1
+            return self._replies, self._rng.uniform(0, self.max_latency)
+
+    def reply(self, chat_history, user_input, on_text=None):
+        reply_id, delay = self._delay()
+        time.sleep(delay)
+        return f"Reply-{reply_id}"
+
+    def questions(self, persona_name, conversation_log):
+        return [f"Question {i}?" for i in range(ROUNDS)]
+
+@pytest.mark.parametrize("pipeline_lag", [1, 2, 4])
+def test_pipelined_meeting_survives_out_of_order_turns(pipeline_lag):
+    for seed in range(15):
+        agents = JitteredAgents(seed)
+        log = persona_core.simulate_meeting_conversation_with_fulltime_preference(
+            agents.reply, agents.reply, persona_name="Persona", max_rounds=ROUNDS, show_banner=False,
+            pipeline_lag=pipeline_lag, question_agent=agents.questions
+        )
+        assert len(TURN_PATTERN.findall(log)) == 4 + 2 * ROUNDS
+
+@pytest.mark.parametrize("pipeline_lag", [1, 2, 4])
+def test_async_pipelined_meeting_survives_out_of_order_turns(pipeline_lag):
+    class AsyncJitteredAgents(JitteredAgents):
+        async def reply(self, chat_history, user_input, on_text=None):
+            reply_id, delay = self._delay()
+            await asyncio.sleep(delay)
+            return f"Reply-{reply_id}"
+
+        async def questions(self, persona_name, conversation_log):
+            return [f"Question {i}?" for i in range(ROUNDS)]
+
+    async def run(seed):
+        agents = AsyncJitteredAgents(seed)
+        return await persona_async.simulate_meeting_conversation_with_fulltime_preference(
+            agents.reply, agents.reply, persona_name="Persona", max_rounds=ROUNDS,
+            pipeline_lag=pipeline_lag, question_agent=agents.questions
+        )
+
+    for seed in range(15):
+        assert len(TURN_PATTERN.findall(asyncio.run(run(seed)))) == 4 + 2 * ROUNDS
@@ -0,0 +1,45 @@
+"""
+Regression tests for the request scheduler: a request that is cancelled or
+interrupted must still give back its in-flight slot.
+
+Run with: python -m pytest -q test_rate_limiter.py
+"""
+import asyncio
+
+import pytest
+
+from rate_limiter import RequestScheduler
+
+def test_cancelled_async_call_releases_its_slot():
+    scheduler = RequestScheduler(max_concurrent=1)
+
+    async def run():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        async def answer():
+            return "ok"
+
+        task = asyncio.create_task(scheduler.call_async(hang))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await asyncio.wait_for(scheduler.call_async(answer), timeout=2)
+
+    assert asyncio.run(run()) == "ok"
+    assert scheduler.metrics()['in_flight'] == 0
+
+def test_interrupted_call_releases_its_slot():
+    scheduler = RequestScheduler(max_concurrent=1)
+
+    def interrupt():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.call(interrupt)
+    assert scheduler.metrics()['in_flight'] == 0
+    assert scheduler.call(lambda: "ok") == "ok"